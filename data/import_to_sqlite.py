@@ -2,14 +2,73 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
+import sys
 import json
 import csv
 import sqlite3
 import glob
+import time
+import queue
+import argparse
+import multiprocessing
 from pathlib import Path
+from dotenv import load_dotenv
+from index_provisioner import provision_indexes
+from type_inference import infer_column_types, make_row_converter, write_back_types, write_type_sidecar
+from incremental_import import ChangeTracker, file_checksum, row_key_and_hash
 
-def create_table_from_json(cursor, json_file):
-    """根据JSON文件创建数据库表"""
+load_dotenv()
+
+# 每次 executemany 的行数
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "50000"))
+# 每个事务提交的行数
+IMPORT_COMMIT_ROWS = int(os.getenv("IMPORT_COMMIT_ROWS", "1000000"))
+# 并行解析CSV的进程数，1 表示在当前进程内解析
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", str(os.cpu_count() or 1)))
+# 导入期间的回滚日志模式：MEMORY 或 OFF（OFF 更快，但导入中断可能损坏数据库）
+IMPORT_JOURNAL_MODE = os.getenv("IMPORT_JOURNAL_MODE", "MEMORY")
+IMPORT_CACHE_SIZE = int(os.getenv("IMPORT_CACHE_SIZE", "-262144"))
+# 推断出的列类型写入的旁路文件；设置了 SCHEMA_TABLES_JSON 时同时写入schema注册表加载的 tables.json
+# 相对路径以 data/ 目录为基准
+IMPORT_TYPES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.getenv("IMPORT_TYPES_PATH", 'column_types.json'))
+SCHEMA_TABLES_JSON = os.getenv("SCHEMA_TABLES_JSON")
+
+def _field_types(schema, column_types=None):
+    """[(字段名, 类型)]：优先使用按取值推断的类型，否则根据字段名称推断"""
+    result = []
+    for field in schema.get('fields', []):
+        field_name = field['name']
+        field_type = 'TEXT'
+        if column_types and field_name in column_types:
+            field_type = column_types[field_name]
+        elif 'date' in field_name.lower():
+            field_type = 'DATE'
+        elif 'amount' in field_name.lower() or 'quantity' in field_name.lower() or 'number' in field_name.lower():
+            field_type = 'NUMERIC'
+        result.append((field_name, field_type))
+    return result
+
+def rebuild_if_schema_changed(cursor, json_file, column_types=None):
+    """已存在的表与本次要建的字段/类型不一致时删除该表（随后按新类型重建并重新导入），返回是否删除。
+
+    CREATE TABLE IF NOT EXISTS 不会修改已有表，不处理的话推断出的类型与实际表结构会不一致。
+    """
+    with open(json_file, 'r', encoding='utf-8') as f:
+        schema = json.load(f)
+    table_name = Path(json_file).stem
+    existing = [(row[1], row[2].upper()) for row in cursor.execute(f"PRAGMA table_info({table_name})")]
+    if not existing or not schema.get('fields'):
+        return False
+    expected = [(name, field_type.upper()) for name, field_type in _field_types(schema, column_types)]
+    if existing == expected:
+        return False
+    print(f"警告: 表 {table_name} 的结构与推断结果不一致，将重建该表: {existing} -> {expected}")
+    cursor.execute(f"DROP TABLE {table_name}")
+    return True
+
+def create_table_from_json(cursor, json_file, column_types=None):
+    """根据JSON文件创建数据库表；column_types 为从CSV取值推断出的 {字段: 类型}，优先于按字段名推断"""
     with open(json_file, 'r', encoding='utf-8') as f:
         schema = json.load(f)
     
@@ -21,22 +80,10 @@ def create_table_from_json(cursor, json_file):
         return None, None
     
     # 构建创建表的SQL语句
-    fields = []
     primary_key = schema.get('primary_key', '')
-    field_names = []
-    
-    for field in schema['fields']:
-        field_name = field['name']
-        field_names.append(field_name)
-        # 根据字段名称推断类型
-        field_type = 'TEXT'
-        if 'date' in field_name.lower():
-            field_type = 'DATE'
-        elif 'amount' in field_name.lower() or 'quantity' in field_name.lower() or 'number' in field_name.lower():
-            field_type = 'NUMERIC'
-        
-        # 不在字段定义中添加PRIMARY KEY约束，而是在最后单独添加
-        fields.append(f"{field_name} {field_type}")
+    columns = _field_types(schema, column_types)
+    field_names = [name for name, _ in columns]
+    fields = [f"{name} {field_type}" for name, field_type in columns]
     
     # 如果没有字段，跳过创建表
     if not fields:
@@ -54,41 +101,243 @@ def create_table_from_json(cursor, json_file):
     
     return table_name, field_names
 
-def import_csv_to_table(cursor, csv_file, table_name, fields):
-    """将CSV文件数据导入到表中"""
-    with open(csv_file, 'r', encoding='utf-8') as f:
+def _iter_csv_chunks(csv_file, table_name, fields, chunk_rows=IMPORT_CHUNK_ROWS, column_types=None, key_fields=None):
+    """流式读取CSV，按块产出 (插入SQL, 行列表)，最后产出 (None, 统计信息)。
+
+    column_types 不为空时按列类型转换取值后再插入。
+    key_fields 不为None时（增量导入），块中每项为 (主键, 行哈希, 行)。
+    """
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
         reader = csv.reader(f)
-        header = next(reader)  # 读取CSV的标题行
-        
+        header = next(reader, None)  # 读取CSV的标题行
+        if header is None:
+            yield None, {"rows": 0, "skipped": 0}
+            return
+
         # 检查CSV标题行与JSON字段是否匹配
         if len(header) != len(fields):
             print(f"警告: {csv_file} 的列数({len(header)})与表定义的字段数({len(fields)})不匹配")
             print(f"CSV标题: {header}")
             print(f"表字段: {fields}")
-            
+
             # 使用CSV标题作为实际字段
             actual_fields = header
         else:
             actual_fields = fields
-        
+
         # 构建插入数据的SQL语句
         placeholders = ', '.join(['?' for _ in actual_fields])
         insert_sql = f"INSERT OR REPLACE INTO {table_name} ({', '.join(actual_fields)}) VALUES ({placeholders})"
-        
-        # 批量插入数据
-        rows = []
+
+        key_indexes = None
+        if key_fields is not None:
+            missing = [k for k in key_fields if k not in actual_fields]
+            if missing:
+                raise ValueError(f"CSV中缺少主键列: {missing}")
+            key_indexes = [actual_fields.index(k) for k in key_fields]
+
+        width = len(actual_fields)
+        convert = make_row_converter(actual_fields, column_types) if column_types else None
+        total = skipped = 0
+        chunk = []
         for row in reader:
             # 确保行数据与字段数量匹配
-            if len(row) != len(actual_fields):
-                print(f"跳过不匹配的行: {row}")
+            if len(row) != width:
+                skipped += 1
+                if skipped <= 10:
+                    print(f"跳过不匹配的行: {row}")
                 continue
-            rows.append(row)
-        
-        if rows:
-            cursor.executemany(insert_sql, rows)
-            print(f"已导入 {len(rows)} 行数据到表 {table_name}")
+            row = convert(row) if convert else row
+            if key_indexes is not None:
+                key, digest = row_key_and_hash(row, key_indexes)
+                chunk.append((key, digest, row))
+            else:
+                chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                total += len(chunk)
+                yield insert_sql, chunk
+                chunk = []
+        if chunk:
+            total += len(chunk)
+            yield insert_sql, chunk
+        yield None, {"rows": total, "skipped": skipped}
+
+def import_csv_to_table(cursor, csv_file, table_name, fields, column_types=None):
+    """将CSV文件数据分块流式导入到表中（单进程）"""
+    for insert_sql, payload in _iter_csv_chunks(csv_file, table_name, fields, column_types=column_types):
+        if insert_sql is None:
+            if payload["rows"]:
+                print(f"已导入 {payload['rows']} 行数据到表 {table_name}")
+            return payload
+        cursor.executemany(insert_sql, payload)
+
+def _parse_worker(job_queue, result_queue, chunk_rows):
+    """解析进程：从任务队列取CSV，解析后按块送往写入进程"""
+    while True:
+        job = job_queue.get()
+        if job is None:
+            return
+        csv_file, table_name, fields, column_types, key_fields = job
+        try:
+            for insert_sql, payload in _iter_csv_chunks(csv_file, table_name, fields, chunk_rows, column_types, key_fields):
+                result_queue.put((table_name, insert_sql, payload))
+        except Exception as e:
+            result_queue.put((table_name, None, {"error": f"{csv_file}: {e}"}))
+
+def _begin_bulk_load(conn):
+    """导入期间关闭同步并使用内存/关闭的回滚日志，返回原设置以便恢复"""
+    previous = (conn.execute("PRAGMA journal_mode").fetchone()[0],
+                conn.execute("PRAGMA synchronous").fetchone()[0])
+    conn.execute(f"PRAGMA journal_mode = {IMPORT_JOURNAL_MODE}")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute(f"PRAGMA cache_size = {IMPORT_CACHE_SIZE}")
+    return previous
+
+def _end_bulk_load(conn, previous):
+    journal_mode, synchronous = previous
+    conn.execute(f"PRAGMA journal_mode = {journal_mode}")
+    conn.execute(f"PRAGMA synchronous = {synchronous}")
+
+STAGING_PREFIX = "_staging_"
+
+def _create_staging_table(conn, table_name):
+    """按原表的建表语句（含主键）创建空的暂存表，返回暂存表名"""
+    stage = f"{STAGING_PREFIX}{table_name}"
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,)).fetchone()
+    conn.execute(f"DROP TABLE IF EXISTS {stage}")
+    conn.execute(re.sub(r'^CREATE TABLE\s+(?:IF NOT EXISTS\s+)?("?)\w+\1', f'CREATE TABLE {stage}', row[0], count=1,
+                        flags=re.IGNORECASE))
+    return stage
+
+def bulk_import(conn, jobs, workers=IMPORT_WORKERS, chunk_rows=IMPORT_CHUNK_ROWS, commit_rows=IMPORT_COMMIT_ROWS,
+                tracker=None):
+    """批量导入多个CSV：多个解析进程并行解析，当前连接作为该数据库唯一的写入者。
+
+    全量导入时每张表先写入暂存表，整个文件解析成功后才替换原表，解析失败的表保留原有数据。
+
+    Args:
+        conn: 目标数据库连接（唯一写入者）
+        jobs: [(csv_file, table_name, fields, column_types, key_fields), ...]，key_fields 为None表示全量导入
+        tracker: 增量导入时的 ChangeTracker，由它比对行哈希后只写入变化的行
+    Returns:
+        {table_name: {"rows": 行数, "skipped": 跳过的行数}}
+    """
+    stats = {}
+    if not jobs:
+        return stats
+    started = time.time()
+    previous = _begin_bulk_load(conn)
+    cursor = conn.cursor()
+    uncommitted = 0
+    # 全量导入先写入暂存表，整张表解析成功后才替换原表；失败时原表保留上次导入的数据
+    staging = {}
+    if tracker is None:
+        staging = {table_name: _create_staging_table(conn, table_name) for _, table_name, _, _, _ in jobs}
+        jobs = [(csv_file, staging[table_name], fields, column_types, key_fields)
+                for csv_file, table_name, fields, column_types, key_fields in jobs]
+    targets = {stage: table_name for table_name, stage in staging.items()}
+
+    def _write(target, insert_sql, payload):
+        nonlocal uncommitted
+        table_name = targets.get(target, target)
+        if insert_sql is None:
+            stats[table_name] = payload
+            if not conn.in_transaction:
+                cursor.execute("BEGIN")
+            if "error" in payload:
+                print(f"导入失败: {payload['error']}")
+                if table_name in staging:
+                    cursor.execute(f"DROP TABLE IF EXISTS {staging[table_name]}")
+                    print(f"表 {table_name} 保留上次导入的数据")
+                # 增量导入的行与行哈希同事务写入、文件校验和未更新，下次运行会重新比对该文件
+            else:
+                if table_name in staging:
+                    cursor.execute(f"DROP TABLE IF EXISTS {table_name}")
+                    cursor.execute(f"ALTER TABLE {staging[table_name]} RENAME TO {table_name}")
+                if tracker is not None:
+                    tracker.finish_table(table_name, payload["rows"])
+                print(f"已导入 {payload['rows']} 行数据到表 {table_name}")
+            return
+        if not conn.in_transaction:
+            cursor.execute("BEGIN")
+        if tracker is not None:
+            tracker.apply_chunk(table_name, insert_sql, payload)
+        else:
+            cursor.executemany(insert_sql, payload)
+        uncommitted += len(payload)
+        # 大事务提交，减少提交次数
+        if uncommitted >= commit_rows:
+            conn.commit()
+            uncommitted = 0
+
+    try:
+        workers = min(workers, len(jobs))
+        if workers <= 1:
+            for csv_file, table_name, fields, column_types, key_fields in jobs:
+                try:
+                    for insert_sql, payload in _iter_csv_chunks(csv_file, table_name, fields, chunk_rows, column_types,
+                                                                key_fields):
+                        _write(table_name, insert_sql, payload)
+                except Exception as e:
+                    # 与并行解析一致：单个文件解析失败只影响该表
+                    if isinstance(e, sqlite3.Error):
+                        raise
+                    _write(table_name, None, {"error": f"{csv_file}: {e}"})
+        else:
+            ctx = multiprocessing.get_context()
+            job_queue = ctx.Queue()
+            # 有界队列：写入跟不上时解析进程阻塞，避免解析结果堆积在内存中
+            result_queue = ctx.Queue(maxsize=workers * 4)
+            for job in jobs:
+                job_queue.put(job)
+            for _ in range(workers):
+                job_queue.put(None)
+            processes = [ctx.Process(target=_parse_worker, args=(job_queue, result_queue, chunk_rows), daemon=True)
+                         for _ in range(workers)]
+            for p in processes:
+                p.start()
+            try:
+                remaining = len(jobs)
+                while remaining:
+                    try:
+                        table_name, insert_sql, payload = result_queue.get(timeout=1)
+                    except queue.Empty:
+                        if not any(p.is_alive() for p in processes):
+                            raise RuntimeError(f"解析进程异常退出，还有 {remaining} 个文件未完成")
+                        continue
+                    _write(table_name, insert_sql, payload)
+                    if insert_sql is None:
+                        remaining -= 1
+            finally:
+                for p in processes:
+                    p.join(timeout=5)
+                    if p.is_alive():
+                        p.terminate()
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        # 中途异常时已提交的暂存表不会被换入，直接丢弃
+        for stage in staging.values():
+            conn.execute(f"DROP TABLE IF EXISTS {stage}")
+        conn.commit()
+        _end_bulk_load(conn, previous)
+
+    elapsed = time.time() - started
+    total = sum(s.get("rows", 0) for s in stats.values())
+    print(f"共导入 {total} 行，耗时 {elapsed:.2f} 秒，{total / elapsed if elapsed > 0 else 0:.0f} 行/秒")
+    return stats
 
 def main():
+    parser = argparse.ArgumentParser(description='将CSV数据导入SQLite数据库')
+    parser.add_argument('--incremental', action='store_true',
+                        help='增量导入：跳过未变化的文件，只写入新增/更新的行并删除已不存在的行')
+    parser.add_argument('--summary', type=str, default=None,
+                        help='增量导入的变更摘要输出路径，默认为数据库同目录下的 import_changes.json')
+    args = parser.parse_args()
+
     # 数据目录
     data_dir = os.path.dirname(os.path.abspath(__file__)) + '/table_headers_simulation'
     
@@ -98,10 +347,19 @@ def main():
     cursor = conn.cursor()
     
     print(f"创建数据库: {db_path}")
+
+    tracker = ChangeTracker(conn) if args.incremental else None
+    if tracker is None:
+        # 全量导入不维护行哈希，清掉旧的增量状态，下次增量导入时重新全量建立
+        cursor.execute("DROP TABLE IF EXISTS _file_checksums")
+        cursor.execute("DROP TABLE IF EXISTS _row_hashes")
     
     # 获取所有CSV文件
     csv_files = glob.glob(os.path.join(data_dir, '*.csv'))
     
+    jobs = []
+    types_by_table = {}
+    sample_failed = []
     for csv_file in csv_files:
         # 检查是否有对应的JSON文件
         json_file = csv_file.replace('.csv', '.json')
@@ -109,22 +367,56 @@ def main():
             print(f"警告: {json_file} 不存在，跳过导入")
             continue
         
-        # 创建表并导入数据
-        result = create_table_from_json(cursor, json_file)
+        # 采样CSV取值推断列类型，据此建表；已有表的结构不一致时重建
+        try:
+            column_types = infer_column_types(csv_file)
+        except (OSError, UnicodeDecodeError, csv.Error) as e:
+            # 采样阶段就读不了的文件只跳过该表，原表数据保持不变
+            print(f"导入失败: {csv_file}: {e}")
+            sample_failed.append(Path(json_file).stem)
+            continue
+        rebuilt = rebuild_if_schema_changed(cursor, json_file, column_types)
+        result = create_table_from_json(cursor, json_file, column_types)
         if result[0] is None or result[1] is None:
             print(f"跳过导入: {json_file}")
             continue
             
         table_name, fields = result
-        import_csv_to_table(cursor, csv_file, table_name, fields)
-        
-        print(f"已导入表: {table_name}")
+        types_by_table[table_name] = column_types
+        if rebuilt and tracker is not None:
+            tracker.forget_table(table_name)
+        key_fields = None
+        if tracker is not None:
+            checksum = file_checksum(csv_file, {"fields": fields, "types": column_types})
+            if tracker.is_unchanged(table_name, checksum):
+                print(f"文件未变化，跳过: {csv_file}")
+                continue
+            with open(json_file, 'r', encoding='utf-8') as f:
+                primary_key = json.load(f).get('primary_key', '')
+            key_fields = [k.strip() for k in primary_key.split(',') if k.strip()]
+            tracker.begin_table(table_name, csv_file, checksum, key_fields)
+        jobs.append((csv_file, table_name, fields, column_types, key_fields))
+    conn.commit()
+
+    # 推断出的类型写入旁路文件，以及schema注册表加载的 tables.json（注册表会自动重新加载）
+    write_type_sidecar(IMPORT_TYPES_PATH, types_by_table)
+    write_back_types(SCHEMA_TABLES_JSON, types_by_table)
+
+    # 并行解析、单连接写入
+    stats = bulk_import(conn, jobs, tracker=tracker)
+    failed = sorted({name for name, stat in stats.items() if "error" in stat} | set(sample_failed))
     
-    # 提交事务并关闭连接
+    # 提交事务后为join键和高频过滤列建立索引，再关闭连接
     conn.commit()
+    provision_indexes(conn)
+    if tracker is not None:
+        tracker.write_summary(args.summary or os.path.join(os.path.dirname(db_path), 'import_changes.json'), db_path)
     conn.close()
     
+    if failed:
+        print(f"以下表导入失败: {failed}")
+        sys.exit(1)
     print("所有CSV文件已成功导入SQLite数据库")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import time
+import hashlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 变更摘要中每张表最多列出的主键数量
+IMPORT_SUMMARY_MAX_KEYS = int(os.getenv("IMPORT_SUMMARY_MAX_KEYS", "1000"))
+
+_LOOKUP_BATCH = 500
+
+
+def row_key_and_hash(row, key_indexes):
+    """返回 (主键JSON, 整行内容哈希)"""
+    key = json.dumps([row[i] for i in key_indexes], ensure_ascii=False)
+    digest = hashlib.sha1(json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode('utf-8')).hexdigest()
+    return key, digest
+
+
+def file_checksum(csv_file, extra=None):
+    """CSV内容（以及建表所用的字段与类型）的sha256，任一变化都视为文件有变化"""
+    h = hashlib.sha256()
+    if extra is not None:
+        h.update(json.dumps(extra, ensure_ascii=False, sort_keys=True).encode('utf-8'))
+    with open(csv_file, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+class ChangeTracker:
+    """基于行哈希的增量导入（CDC）。
+
+    在目标库中维护两张辅助表：
+    - _file_checksums: 每张表上次导入的CSV校验和，未变化的文件直接跳过；
+    - _row_hashes: 每行按主键记录的内容哈希，用于区分新增、更新与未变化的行。
+    导入结束后，本次CSV中不再出现的主键视为删除。
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.tables = {}
+        self.started = time.time()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS _file_checksums (
+                table_name TEXT PRIMARY KEY,
+                path TEXT,
+                checksum TEXT NOT NULL,
+                rows INTEGER,
+                updated_at REAL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS _row_hashes (
+                table_name TEXT NOT NULL,
+                pk TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                PRIMARY KEY (table_name, pk)
+            ) WITHOUT ROWID
+        """)
+        conn.commit()
+
+    def _seen_keys(self):
+        # 临时表在修改 temp_store 等设置时会被清掉，每次使用前确保存在
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS _seen_keys (table_name TEXT, pk TEXT, "
+                          "PRIMARY KEY (table_name, pk)) WITHOUT ROWID")
+
+    def forget_table(self, table_name):
+        """表被删除重建后，清掉它的导入记录与行哈希，按新表全量导入"""
+        self.conn.execute("DELETE FROM _file_checksums WHERE table_name = ?", (table_name,))
+        self.conn.execute("DELETE FROM _row_hashes WHERE table_name = ?", (table_name,))
+
+    def is_unchanged(self, table_name, checksum):
+        row = self.conn.execute("SELECT checksum FROM _file_checksums WHERE table_name = ?", (table_name,)).fetchone()
+        if row is not None and row[0] == checksum:
+            self.tables[table_name] = {"status": "unchanged", "inserted": 0, "updated": 0, "deleted": 0}
+            return True
+        return False
+
+    def begin_table(self, table_name, csv_file, checksum, key_fields):
+        """开始处理一张有变化的表。
+
+        以前没有导入记录（或表没有主键）时无法逐行比对，先清空该表及其行哈希再全量导入。
+        """
+        known = self.conn.execute("SELECT 1 FROM _file_checksums WHERE table_name = ?", (table_name,)).fetchone()
+        entry = {"status": "changed", "inserted": 0, "updated": 0, "deleted": 0,
+                 "changed_keys": [], "deleted_keys": [],
+                 "_path": csv_file, "_checksum": checksum, "_key_fields": key_fields}
+        if known is None or not key_fields:
+            entry["status"] = "reloaded" if known is not None else "new"
+            entry["deleted"] = self.conn.execute(f"SELECT count(*) FROM {table_name}").fetchone()[0]
+            self.conn.execute(f"DELETE FROM {table_name}")
+            self.conn.execute("DELETE FROM _row_hashes WHERE table_name = ?", (table_name,))
+        self._seen_keys()
+        self.conn.execute("DELETE FROM _seen_keys WHERE table_name = ?", (table_name,))
+        self.tables[table_name] = entry
+
+    def _note_keys(self, entry, name, keys):
+        room = IMPORT_SUMMARY_MAX_KEYS - len(entry[name])
+        if room > 0:
+            entry[name].extend(json.loads(k) for k in keys[:room])
+
+    def apply_chunk(self, table_name, insert_sql, items):
+        """写入一块 (主键, 哈希, 行)，只对新增和内容变化的行执行写入"""
+        entry = self.tables[table_name]
+        cursor = self.conn.cursor()
+        if not entry["_key_fields"]:
+            cursor.executemany(insert_sql, [row for _, _, row in items])
+            entry["inserted"] += len(items)
+            return
+
+        self._seen_keys()
+        existing = {}
+        keys = [key for key, _, _ in items]
+        for i in range(0, len(keys), _LOOKUP_BATCH):
+            batch = keys[i:i + _LOOKUP_BATCH]
+            placeholders = ', '.join('?' for _ in batch)
+            existing.update(cursor.execute(
+                f"SELECT pk, hash FROM _row_hashes WHERE table_name = ? AND pk IN ({placeholders})",
+                [table_name] + batch).fetchall())
+
+        rows, hashes, changed = [], [], []
+        for key, digest, row in items:
+            old = existing.get(key)
+            if old == digest:
+                continue
+            entry["inserted" if old is None else "updated"] += 1
+            existing[key] = digest
+            rows.append(row)
+            hashes.append((table_name, key, digest))
+            changed.append(key)
+        if rows:
+            cursor.executemany(insert_sql, rows)
+            cursor.executemany("INSERT OR REPLACE INTO _row_hashes (table_name, pk, hash) VALUES (?, ?, ?)", hashes)
+            if entry["status"] == "changed":
+                self._note_keys(entry, "changed_keys", changed)
+        cursor.executemany("INSERT OR IGNORE INTO _seen_keys (table_name, pk) VALUES (?, ?)",
+                           [(table_name, key) for key in keys])
+
+    def finish_table(self, table_name, rows):
+        """删除本次CSV中不再出现的行，并记录新的文件校验和"""
+        entry = self.tables[table_name]
+        key_fields = entry["_key_fields"]
+        cursor = self.conn.cursor()
+        self._seen_keys()
+        if key_fields and entry["status"] == "changed":
+            gone = [r[0] for r in cursor.execute(
+                "SELECT pk FROM _row_hashes WHERE table_name = ? AND pk NOT IN "
+                "(SELECT pk FROM _seen_keys WHERE table_name = ?)", (table_name, table_name))]
+            if gone:
+                where = ' AND '.join(f"{k} = ?" for k in key_fields)
+                cursor.executemany(f"DELETE FROM {table_name} WHERE {where}", [json.loads(k) for k in gone])
+                cursor.executemany("DELETE FROM _row_hashes WHERE table_name = ? AND pk = ?",
+                                   [(table_name, k) for k in gone])
+                entry["deleted"] += len(gone)
+                self._note_keys(entry, "deleted_keys", gone)
+        cursor.execute("DELETE FROM _seen_keys WHERE table_name = ?", (table_name,))
+        cursor.execute(
+            "INSERT OR REPLACE INTO _file_checksums (table_name, path, checksum, rows, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (table_name, entry["_path"], entry["_checksum"], rows, time.time()))
+
+    def summary(self, db_path=None):
+        tables = {}
+        for name, entry in self.tables.items():
+            item = {k: v for k, v in entry.items() if not k.startswith("_")}
+            # 全量重建的表无法给出逐行变化，下游应整体失效
+            if item["status"] in ("new", "reloaded"):
+                item.pop("changed_keys", None)
+                item.pop("deleted_keys", None)
+            tables[name] = item
+        return {
+            "generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "db_path": db_path,
+            "elapsed_seconds": round(time.time() - self.started, 3),
+            "changed_tables": sorted(n for n, t in tables.items() if t["status"] != "unchanged"),
+            "tables": tables,
+        }
+
+    def write_summary(self, path, db_path=None):
+        summary = self.summary(db_path)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=4)
+        print(f"变更摘要已写入: {path}，有变化的表: {summary['changed_tables']}")
+        return summary
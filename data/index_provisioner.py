@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import json
+import glob
+import sqlite3
+import argparse
+from collections import Counter
+from pathlib import Path
+from dotenv import load_dotenv
+
+try:
+    from tools.query_governor import QUERY_LOG_PATH
+except ImportError:
+    # 作为脚本直接运行时，把项目根目录加入导入路径
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from tools.query_governor import QUERY_LOG_PATH
+
+load_dotenv()
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB_PATH = os.path.join(DATA_DIR, 'tables.db')
+DEFAULT_HEADERS_DIR = os.path.join(DATA_DIR, 'table_headers_simulation')
+DEFAULT_RELATION_PATH = os.path.join(DATA_DIR, 'table_ontology_simulation', 'relation.json')
+DEFAULT_TABLES_JSON = os.path.join(DATA_DIR, 'table_ontology_simulation', 'tables.json')
+# 某列在查询日志的WHERE条件中出现至少这么多次才为其建立二级索引
+INDEX_MIN_FILTER_COUNT = int(os.getenv("INDEX_MIN_FILTER_COUNT", "3"))
+
+# 自动维护的索引前缀：join键索引与查询日志挖掘出的过滤列索引
+JOIN_INDEX_PREFIX = "idx_join_"
+AUTO_INDEX_PREFIX = "idx_auto_"
+
+_IDENT = r'(?:"[^"]+"|[A-Za-z_][\w]*)'
+_TABLE_REF = re.compile(
+    rf'(?:\bFROM\b|\bJOIN\b|,)\s*({_IDENT}(?:\s*\.\s*{_IDENT})?)'
+    rf'(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|LEFT|INNER|OUTER|CROSS|NATURAL|USING|GROUP|ORDER|LIMIT|UNION|HAVING)\b)({_IDENT}))?',
+    re.IGNORECASE
+)
+_WHERE = re.compile(r'\bWHERE\b(.*?)(?=\bGROUP\s+BY\b|\bORDER\s+BY\b|\bLIMIT\b|\bHAVING\b|\bUNION\b|$)',
+                    re.IGNORECASE | re.DOTALL)
+_PREDICATE = re.compile(
+    rf'(?:({_IDENT})\s*\.\s*)?({_IDENT})\s*(?:=|<>|!=|<=|>=|<|>|\bIN\b|\bLIKE\b|\bBETWEEN\b|\bIS\b)',
+    re.IGNORECASE
+)
+
+
+def _unquote(name):
+    return name.strip().strip('"')
+
+
+def load_table_codes(headers_dir=DEFAULT_HEADERS_DIR, tables_json=DEFAULT_TABLES_JSON):
+    """中文表名 -> 库中的表名（表代码，即表头JSON的文件名）"""
+    codes = {}
+    for json_file in glob.glob(os.path.join(headers_dir, '*.json')):
+        try:
+            with open(json_file, 'r', encoding='utf-8') as f:
+                header = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            continue
+        stem = Path(json_file).stem
+        if header.get('table_name_zh'):
+            codes[header['table_name_zh']] = stem
+        codes[stem] = stem
+
+    if tables_json and os.path.exists(tables_json):
+        with open(tables_json, 'r', encoding='utf-8') as f:
+            tables = json.load(f).get('tables', [])
+        for item in tables:
+            code = item.get('table')
+            if not code and item.get('header_ref'):
+                code = Path(item['header_ref']).stem
+            if code and item.get('table_name'):
+                codes[item['table_name']] = code
+    return codes
+
+
+def table_columns(cursor, table):
+    return [row[1] for row in cursor.execute(f'PRAGMA table_info("{table}")')]
+
+
+def _leading_columns(cursor, table):
+    """表上已有索引（含主键自动索引）的前缀列组合"""
+    prefixes = set()
+    for row in cursor.execute(f'PRAGMA index_list("{table}")').fetchall():
+        cols = tuple(r[2] for r in cursor.execute(f'PRAGMA index_info("{row[1]}")').fetchall())
+        for i in range(1, len(cols) + 1):
+            prefixes.add(cols[:i])
+    pk = [r for r in cursor.execute(f'PRAGMA table_info("{table}")') if r[5]]
+    pk_cols = tuple(r[1] for r in sorted(pk, key=lambda r: r[5]))
+    for i in range(1, len(pk_cols) + 1):
+        prefixes.add(pk_cols[:i])
+    return prefixes
+
+
+def join_key_indexes(cursor, relation_path=DEFAULT_RELATION_PATH, codes=None):
+    """根据 relation.json 的 join_key 为关系两端的表规划索引，返回 {索引名: (表, 列元组)}"""
+    if not os.path.exists(relation_path):
+        print(f"警告: {relation_path} 不存在，跳过join键索引")
+        return {}
+    with open(relation_path, 'r', encoding='utf-8') as f:
+        relations = json.load(f).get('relation', [])
+    codes = codes or {}
+
+    plans = {}
+    for r in relations:
+        keys = r.get('join_key') or []
+        if isinstance(keys, str):
+            keys = [keys]
+        for name in (r.get('source'), r.get('target')):
+            table = codes.get(name, name)
+            columns = table_columns(cursor, table)
+            cols = tuple(k for k in keys if k in columns)
+            if not cols:
+                continue
+            index_name = f"{JOIN_INDEX_PREFIX}{table}_{'_'.join(cols)}"
+            plans[index_name] = (table, cols)
+    return plans
+
+
+def mine_filter_columns(cursor, log_path=QUERY_LOG_PATH):
+    """统计 search_database 查询日志中WHERE条件里出现的 (表, 列) 次数"""
+    counts = Counter()
+    if not os.path.exists(log_path):
+        return counts
+    known = {row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    columns_of = {}
+
+    with open(log_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get('status') not in ('ok', 'timeout', 'step_budget'):
+                continue
+            # 去掉字符串常量，避免其中的内容被误认为列名
+            sql = re.sub(r"'(?:''|[^'])*'", "''", record.get('sql') or '')
+            # 别名/表名 -> 本库中的表名
+            aliases = {}
+            for m in _TABLE_REF.finditer(sql):
+                table = _unquote(m.group(1).split('.')[-1])
+                if table not in known:
+                    continue
+                aliases[table] = table
+                if m.group(2):
+                    aliases[_unquote(m.group(2))] = table
+            if not aliases:
+                continue
+            for table in set(aliases.values()):
+                if table not in columns_of:
+                    columns_of[table] = set(table_columns(cursor, table))
+
+            seen = set()
+            for where in _WHERE.finditer(sql):
+                for m in _PREDICATE.finditer(where.group(1)):
+                    column = _unquote(m.group(2))
+                    if m.group(1):
+                        candidates = [aliases.get(_unquote(m.group(1)))]
+                    else:
+                        candidates = set(aliases.values())
+                    for table in candidates:
+                        if table and column in columns_of[table]:
+                            seen.add((table, column))
+            counts.update(seen)
+    return counts
+
+
+def provision_indexes(conn, relation_path=DEFAULT_RELATION_PATH, headers_dir=DEFAULT_HEADERS_DIR,
+                      tables_json=DEFAULT_TABLES_JSON, log_path=QUERY_LOG_PATH, min_count=INDEX_MIN_FILTER_COUNT):
+    """创建join键索引与高频过滤列索引，删除不再需要的自动索引，最后ANALYZE更新统计信息"""
+    cursor = conn.cursor()
+    codes = load_table_codes(headers_dir, tables_json)
+    plans = join_key_indexes(cursor, relation_path, codes)
+    for (table, column), count in mine_filter_columns(cursor, log_path).items():
+        if count >= min_count:
+            plans[f"{AUTO_INDEX_PREFIX}{table}_{column}"] = (table, (column,))
+
+    # 只删除由本工具维护、且已不在计划中的索引
+    existing = {row[0] for row in cursor.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND (name LIKE ? OR name LIKE ?)",
+        (JOIN_INDEX_PREFIX + '%', AUTO_INDEX_PREFIX + '%'))}
+    if not os.path.exists(log_path):
+        # 没有查询日志时无从判断过滤列是否仍然高频，保留已有的过滤列索引
+        for name in existing:
+            if name.startswith(AUTO_INDEX_PREFIX):
+                plans[name] = None
+    for name in sorted(existing - set(plans)):
+        print(f"删除不再使用的索引: {name}")
+        cursor.execute(f'DROP INDEX IF EXISTS "{name}"')
+
+    created = []
+    for name, plan in sorted(plans.items()):
+        if name in existing:
+            continue
+        table, cols = plan
+        # 主键或已有索引已覆盖该列组合时跳过
+        if cols in _leading_columns(cursor, table):
+            continue
+        col_sql = ', '.join(f'"{c}"' for c in cols)
+        print(f"创建索引: {name} ON {table}({', '.join(cols)})")
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table}" ({col_sql})')
+        created.append(name)
+
+    cursor.execute("ANALYZE")
+    conn.commit()
+    print(f"索引维护完成: 新建 {len(created)} 个, 删除 {len(existing - set(plans))} 个")
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description='为SQLite数据表维护join键索引与高频过滤列索引')
+    parser.add_argument('--db', type=str, default=DEFAULT_DB_PATH, help='SQLite数据库路径')
+    parser.add_argument('--relation', type=str, default=DEFAULT_RELATION_PATH, help='relation.json 路径')
+    parser.add_argument('--headers_dir', type=str, default=DEFAULT_HEADERS_DIR, help='表头JSON所在目录')
+    parser.add_argument('--tables_json', type=str, default=DEFAULT_TABLES_JSON, help='tables.json 路径')
+    parser.add_argument('--query_log', type=str, default=QUERY_LOG_PATH, help='search_database 查询日志路径')
+    parser.add_argument('--min_count', type=int, default=INDEX_MIN_FILTER_COUNT, help='过滤列建索引的最少出现次数')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        provision_indexes(conn, args.relation, args.headers_dir, args.tables_json, args.query_log, args.min_count)
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
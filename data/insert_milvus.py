@@ -1,9 +1,20 @@
 import os
 import re
 import json
-import requests
+import hashlib
+import argparse
 from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
 from dotenv import load_dotenv
+from vector_index import TABLE_RETRIEVAL_BACKEND, build_local_index
+from keyword_index import build_keyword_index
+
+try:
+    from models.embedding_client import get_embedding_client
+except ImportError:
+    # 作为脚本直接运行时，把项目根目录加入导入路径
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from models.embedding_client import get_embedding_client
 
 # 加载环境变量
 load_dotenv()
@@ -13,6 +24,16 @@ MILVUS_HOST = os.getenv('MILVUS_HOST', '127.0.0.1')
 MILVUS_PORT = os.getenv('MILVUS_PORT', '19530')
 COLLECTION_NAME = os.getenv('MILVUS_COLLECTION_NAME', 'test')
 EMBEDDING_SERVICE_URL = os.getenv('EMBEDDING_SERVICE_URL', 'http://127.0.0.1:12345/embed')
+# 增量同步时变化（新增、更新、删除）的表占比超过该值才重建向量索引
+MILVUS_SYNC_REINDEX_FRACTION = float(os.getenv('MILVUS_SYNC_REINDEX_FRACTION', '0.3'))
+# 分页读取已有实体时每批的条数
+MILVUS_QUERY_BATCH = 1000
+
+VECTOR_INDEX_PARAMS = {
+    "index_type": "IVF_FLAT",
+    "params": {"nlist": 128},
+    "metric_type": "L2"
+}
 
 # JSON文件路径
 JSON_FILE_PATH = os.path.join(os.path.dirname(__file__), 'table_ontology', 'tables.json')
@@ -60,31 +81,22 @@ def create_collection(dim=1024):
         FieldSchema(name="table_description", dtype=DataType.VARCHAR, max_length=65535),  # 表描述
         FieldSchema(name="headers_description", dtype=DataType.VARCHAR, max_length=65535),  # 表头描述
         FieldSchema(name="example", dtype=DataType.VARCHAR, max_length=65535),  # 示例数据
+        FieldSchema(name="content_hash", dtype=DataType.VARCHAR, max_length=64),  # 表元数据内容哈希，用于增量同步
         FieldSchema(name="table_name_embedding", dtype=DataType.FLOAT_VECTOR, dim=dim),  # 表名向量
         FieldSchema(name="table_description_embedding", dtype=DataType.FLOAT_VECTOR, dim=dim)  # 表描述向量
     ]
     schema = CollectionSchema(fields, description="Table Headers Collection")
     collection = Collection(name=COLLECTION_NAME, schema=schema)
     
-    index_params = {
-        "index_type": "IVF_FLAT",
-        "params": {"nlist": 128},
-        "metric_type": "L2"
-    }
-    collection.create_index(field_name="table_name_embedding", index_params=index_params)
-    collection.create_index(field_name="table_description_embedding", index_params=index_params)
+    collection.create_index(field_name="table_name_embedding", index_params=VECTOR_INDEX_PARAMS)
+    collection.create_index(field_name="table_description_embedding", index_params=VECTOR_INDEX_PARAMS)
     
     print(f"Collection {COLLECTION_NAME} created with indexes.")
     return collection
 
 def get_embedding(text):
-    payload = {"texts": [text]}
-    response = requests.post(EMBEDDING_SERVICE_URL, json=payload)
-    if response.status_code == 200:
-        # API返回的是一个embedding列表，我们取第一个
-        return response.json()[0]
-    else:
-        raise Exception(f"Embedding service error: {response.text}")
+    # 共享的向量化客户端：带内容哈希缓存，同一文本不会重复请求服务
+    return get_embedding_client().embed_one(text)
 
 def read_json_file():
     if not os.path.exists(JSON_FILE_PATH):
@@ -96,6 +108,27 @@ def read_json_file():
     with open(JSON_FILE_PATH, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+def embed_tables(table_names, table_descriptions):
+    # 表名与表描述一次性批量向量化，未变化的元数据直接命中缓存
+    embeddings = get_embedding_client().embed(table_names + table_descriptions)
+    return embeddings[:len(table_names)], embeddings[len(table_names):]
+
+def build_local(data_list):
+    # 本地后端：不连接Milvus，直接构建进程内向量索引
+    table_name_embeddings, table_description_embeddings = embed_tables(
+        [data["table_name"] for data in data_list],
+        [data["table_description"] for data in data_list])
+    return build_local_index(data_list, {
+        "table_name_embedding": table_name_embeddings,
+        "table_description_embedding": table_description_embeddings,
+    })
+
+def content_hash(data):
+    # 参与入库的四个文本字段任一变化，哈希即变化
+    payload = json.dumps([data["table_name"], data["table_description"], data["headers_description"], data["example"]],
+                         ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
 def insert_data(collection, data_list):
     if not data_list:
         print("No data to insert")
@@ -105,23 +138,23 @@ def insert_data(collection, data_list):
     table_descriptions = []
     headers_descriptions = []
     examples = []
-    table_name_embeddings = []
-    table_description_embeddings = []
+    content_hashes = []
     
     for data in data_list:
         table_names.append(data["table_name"])
         table_descriptions.append(data["table_description"])
         headers_descriptions.append(data["headers_description"])
         examples.append(data["example"])
-        
-        table_name_embeddings.append(get_embedding(data["table_name"]))
-        table_description_embeddings.append(get_embedding(data["table_description"]))
+        content_hashes.append(content_hash(data))
+    
+    table_name_embeddings, table_description_embeddings = embed_tables(table_names, table_descriptions)
     
     entities = [
         table_names,
         table_descriptions,
         headers_descriptions,
         examples,
+        content_hashes,
         table_name_embeddings,
         table_description_embeddings
     ]
@@ -168,14 +201,104 @@ def drop_collection():
         utility.drop_collection(COLLECTION_NAME)
         print(f"Collection {COLLECTION_NAME} dropped.")
 
-def main():
-    connect_to_milvus()
+def rebuild_collection(data_list):
     drop_collection()
     collection = create_collection()
+    insert_data(collection, data_list)
+    collection.flush()
+    return collection
+
+def rebuild_indexes(collection):
+    collection.release()
+    for field in ("table_name_embedding", "table_description_embedding"):
+        collection.drop_index(index_name=next(i.index_name for i in collection.indexes if i.field_name == field))
+        collection.create_index(field_name=field, index_params=VECTOR_INDEX_PARAMS)
+    collection.load()
+    print(f"Indexes of collection {COLLECTION_NAME} rebuilt.")
+
+def fetch_stored_entities(collection, batch_size=MILVUS_QUERY_BATCH):
+    # 单次 query 最多返回 16384 条，用迭代器分页读完全部实体
+    iterator = collection.query_iterator(batch_size=batch_size, expr='id >= 0',
+                                         output_fields=["id", "table_name", "content_hash"])
+    rows = []
+    try:
+        while True:
+            batch = iterator.next()
+            if not batch:
+                break
+            rows.extend(batch)
+    finally:
+        iterator.close()
+    return rows
+
+def sync_collection(data_list, reindex_fraction=MILVUS_SYNC_REINDEX_FRACTION):
+    """按 表名 + 内容哈希 把 tables.json 增量同步到集合。
+
+    只对新增和内容变化的表重新向量化并写入（先删后插，主键为自增id），删除已不存在的表；
+    变化占比超过 reindex_fraction 时重建向量索引，否则沿用已有索引。
+    集合不存在或是没有 content_hash 字段的旧结构时退回全量重建。
+    """
+    if not utility.has_collection(COLLECTION_NAME):
+        print(f"Collection {COLLECTION_NAME} does not exist, creating it.")
+        return rebuild_collection(data_list)
+    collection = Collection(name=COLLECTION_NAME)
+    if not any(field.name == "content_hash" for field in collection.schema.fields):
+        print(f"Collection {COLLECTION_NAME} has no content_hash field, rebuilding it.")
+        return rebuild_collection(data_list)
+
+    collection.load()
+    stored = fetch_stored_entities(collection)
+    stored_by_name = {}
+    stale_ids = []
+    for row in stored:
+        # 同名的重复实体只保留一条
+        if row["table_name"] in stored_by_name:
+            stale_ids.append(row["id"])
+        else:
+            stored_by_name[row["table_name"]] = row
+
+    wanted = {data["table_name"]: data for data in data_list}
+    changed = []
+    for name, data in wanted.items():
+        old = stored_by_name.get(name)
+        if old is None or old["content_hash"] != content_hash(data):
+            changed.append(data)
+            if old is not None:
+                stale_ids.append(old["id"])
+    removed = [row for name, row in stored_by_name.items() if name not in wanted]
+    stale_ids.extend(row["id"] for row in removed)
+
+    if stale_ids:
+        collection.delete(expr=f"id in {stale_ids}")
+    if changed:
+        insert_data(collection, changed)
+    collection.flush()
+
+    total_changes = len(changed) + len(removed)
+    print(f"Synced collection {COLLECTION_NAME}: {len(changed)} upserted, {len(removed)} removed, "
+          f"{len(wanted) - len(changed)} unchanged")
+    if total_changes and total_changes / max(len(stored_by_name), len(wanted), 1) > reindex_fraction:
+        rebuild_indexes(collection)
+    return collection
+
+def main():
+    parser = argparse.ArgumentParser(description='把 tables.json 中的表元数据写入Milvus')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='删除并重建集合、全量重新向量化；默认按内容哈希增量同步')
+    args = parser.parse_args()
 
-    # 读取并插入数据
     data_list = read_json_file().get("tables", [])
-    insert_data(collection, data_list)
+    # 表头倒排索引随入库一起构建，供混合检索的关键词召回使用
+    build_keyword_index(data_list)
+    if TABLE_RETRIEVAL_BACKEND == "local":
+        build_local(data_list)
+        return
+
+    connect_to_milvus()
+    if args.rebuild:
+        collection = rebuild_collection(data_list)
+    else:
+        collection = sync_collection(data_list)
 
     # 示例查询 - 向量查询表名
     query_table_name = "销售"
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import math
+import json
+import tempfile
+from collections import Counter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+# 相对路径以 data/ 目录为基准，与运行时的工作目录无关
+KEYWORD_INDEX_PATH = os.path.join(DATA_DIR, os.getenv("KEYWORD_INDEX_PATH", 'keyword_index.json'))
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# 建索引的文本字段：表头描述
+INDEXED_FIELD = "headers_description"
+RECORD_FIELDS = ["table_name", "table_description", "headers_description", "example"]
+
+_TOKEN = re.compile(r'[一-鿿]+|[A-Za-z0-9]+')
+
+
+def tokenize(text):
+    """中文按相邻二字切分（单字成词时保留单字），英文与数字按单词切分并转小写"""
+    tokens = []
+    for run in _TOKEN.findall(text or ""):
+        if run.isascii():
+            tokens.append(run.lower())
+        elif len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def build_keyword_index(records, path=KEYWORD_INDEX_PATH):
+    """在入库时对表头描述建立倒排索引并写入 path，返回 KeywordIndex"""
+    postings = {}
+    doc_len = []
+    for doc_id, record in enumerate(records):
+        counts = Counter(tokenize(record.get(INDEXED_FIELD, "")))
+        doc_len.append(sum(counts.values()))
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append([doc_id, tf])
+    data = {
+        "field": INDEXED_FIELD,
+        "records": [{k: r.get(k, "") for k in RECORD_FIELDS} for r in records],
+        "doc_len": doc_len,
+        "postings": postings,
+    }
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # 先写临时文件再替换，检索进程不会读到写了一半的索引
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    print(f"关键词倒排索引已写入 {path}: {len(records)} 张表, {len(postings)} 个词项")
+    return KeywordIndex(data)
+
+
+class KeywordIndex:
+    """表头文本上的BM25倒排索引，查询只访问查询词项的倒排表"""
+
+    def __init__(self, data):
+        self.records = data["records"]
+        self.doc_len = data["doc_len"]
+        self.postings = data["postings"]
+        self.avgdl = (sum(self.doc_len) / len(self.doc_len)) if self.doc_len else 0.0
+
+    @classmethod
+    def load(cls, path=KEYWORD_INDEX_PATH):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"关键词倒排索引不存在: {path}，请先运行 insert_milvus.py 构建")
+        with open(path, 'r', encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, query, top_k=10, k1=BM25_K1, b=BM25_B):
+        """返回 [(BM25得分, 表记录)]，按得分降序"""
+        n = len(self.records)
+        scores = {}
+        for term, qtf in Counter(tokenize(query)).items():
+            plist = self.postings.get(term)
+            if not plist:
+                continue
+            idf = math.log(1 + (n - len(plist) + 0.5) / (len(plist) + 0.5))
+            for doc_id, tf in plist:
+                norm = k1 * (1 - b + b * self.doc_len[doc_id] / (self.avgdl or 1))
+                scores[doc_id] = scores.get(doc_id, 0.0) + qtf * idf * tf * (k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: -item[1])[:top_k]
+        return [(score, dict(self.records[doc_id])) for doc_id, score in best]
+
+
+_index = None
+_index_mtime = None
+
+
+def get_keyword_index(path=KEYWORD_INDEX_PATH):
+    """进程内共享的倒排索引，索引文件重建后自动重新加载"""
+    global _index, _index_mtime
+    mtime = os.path.getmtime(path) if os.path.exists(path) else None
+    if _index is None or mtime != _index_mtime:
+        _index = KeywordIndex.load(path)
+        _index_mtime = mtime
+    return _index
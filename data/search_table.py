@@ -1,81 +1,32 @@
 #!/usr/bin/env python3
-import os
 import argparse
-import requests
-from pymilvus import connections, Collection, utility
 from dotenv import load_dotenv
+from table_retrieval import get_retrieval_service
 
 # 加载环境变量
 load_dotenv()
 
-# 从环境变量获取配置
-MILVUS_HOST = os.getenv('MILVUS_HOST', '127.0.0.1')
-MILVUS_PORT = os.getenv('MILVUS_PORT', '19530')
-COLLECTION_NAME = os.getenv('MILVUS_COLLECTION_NAME', 'test')
-EMBEDDING_SERVICE_URL = os.getenv('EMBEDDING_SERVICE_URL', 'http://127.0.0.1:12345/embed')
-
-# 连接 Milvus
-def connect_to_milvus():
-    connections.connect(host=MILVUS_HOST, port=MILVUS_PORT)
-    print("Connected to Milvus")
-    
-    if not utility.has_collection(COLLECTION_NAME):
-        print(f"Collection {COLLECTION_NAME} does not exist. Please run register_table_header.py first.")
+# 连接检索后端（Milvus 或本地向量索引）；服务在进程内共享，只连接、加载一次
+def open_retrieval_backend():
+    service = get_retrieval_service()
+    try:
+        service.connect()
+    except (RuntimeError, FileNotFoundError) as e:
+        print(str(e))
         return None
-    
-    return Collection(name=COLLECTION_NAME)
+    return service
 
-# 获取 Embedding
-def get_embedding(text):
-    payload = {"texts": [text]}
-    response = requests.post(EMBEDDING_SERVICE_URL, json=payload)
-    if response.status_code == 200:
-        # API返回的是一个embedding列表，我们取第一个
-        return response.json()[0]
-    else:
-        raise Exception(f"Embedding service error: {response.text}")
+# 向量查询（表名或表描述）；query_text 为列表时一次请求完成多条查询
+def vector_search(service, query_text, field="table_name", top_k=5):
+    return service.search(query_text, field, top_k)
 
-# 向量查询（表名或表描述）
-def vector_search(collection, query_text, field="table_name", top_k=5):
-    query_embedding = get_embedding(query_text)
-    collection.load()
-    
-    # 根据查询字段选择对应的向量字段
-    if field == "table_name":
-        vector_field = "table_name_embedding"
-    elif field == "table_description":
-        vector_field = "table_description_embedding"
-    else:
-        raise ValueError("Invalid field for vector search. Use 'table_name' or 'table_description'")
-    
-    search_params = {"metric_type": "L2", "params": {"nprobe": 10}}
-    results = collection.search(
-        data=[query_embedding],
-        anns_field=vector_field,
-        param=search_params,
-        limit=top_k,
-        output_fields=["table_name", "table_description", "headers_description", "example"]
-    )
-    
-    return results[0]
+# 混合查询：两路向量召回 + 表头BM25倒排索引，倒数排名融合
+def hybrid_search(service, query_text, top_k=5):
+    return service.hybrid_search(query_text, top_k)
 
 # 关键词查询（支持所有文本字段）
-def keyword_search(collection, keyword, field="headers_description"):
-    collection.load()
-    
-    # 确保字段名有效
-    valid_fields = ["table_name", "table_description", "headers_description", "example"]
-    if field not in valid_fields:
-        raise ValueError(f"Invalid field for keyword search. Use one of {valid_fields}")
-    
-    # 使用字符串匹配查询
-    expr = f'{field} like "%{keyword}%"'
-    results = collection.query(
-        expr=expr,
-        output_fields=["table_name", "table_description", "headers_description", "example"]
-    )
-    
-    return results
+def keyword_search(service, keyword, field="headers_description"):
+    return service.query(keyword, field)
 
 # 打印查询结果
 def print_results(results, query_type="vector"):
@@ -96,6 +47,16 @@ def print_results(results, query_type="vector"):
             print(f"表头描述: {hit.entity.get('headers_description')}")
             print(f"示例数据: {hit.entity.get('example')}")
             print("-" * 80)
+    elif query_type == "hybrid":
+        # 混合查询结果
+        for i, result in enumerate(results):
+            print(f"结果 {i+1}:")
+            print(f"融合得分: {result['score']:.4f}  各路名次: {result['ranks']}")
+            print(f"表名: {result['table_name']}")
+            print(f"表描述: {result['table_description']}")
+            print(f"表头描述: {result['headers_description']}")
+            print(f"示例数据: {result['example']}")
+            print("-" * 80)
     else:
         # 关键词查询结果
         for i, result in enumerate(results):
@@ -108,18 +69,19 @@ def print_results(results, query_type="vector"):
 
 def main():
     parser = argparse.ArgumentParser(description='表格数据查询工具')
-    parser.add_argument('--query', '-q', type=str, required=True, help='查询文本')
-    parser.add_argument('--mode', '-m', type=str, default='vector', choices=['vector', 'keyword'], 
-                        help='查询模式: vector(向量查询) 或 keyword(关键词查询)')
+    parser.add_argument('--query', '-q', type=str, nargs='+', required=True,
+                        help='查询文本，向量查询时可给出多条，一次批量检索')
+    parser.add_argument('--mode', '-m', type=str, default='vector', choices=['vector', 'keyword', 'hybrid'], 
+                        help='查询模式: vector(向量查询)、keyword(关键词查询) 或 hybrid(混合查询)')
     parser.add_argument('--field', '-f', type=str, default='table_name', 
                         help='查询字段: table_name, table_description, headers_description, example')
-    parser.add_argument('--top_k', '-k', type=int, default=3, help='返回结果数量 (仅向量查询)')
+    parser.add_argument('--top_k', '-k', type=int, default=3, help='返回结果数量 (向量查询与混合查询)')
     
     args = parser.parse_args()
     
-    # 连接到Milvus
-    collection = connect_to_milvus()
-    if collection is None:
+    # 连接到Milvus（或加载本地向量索引）
+    service = open_retrieval_backend()
+    if service is None:
         return
     
     try:
@@ -130,16 +92,25 @@ def main():
                 print("自动切换到 'table_name' 字段进行查询")
                 args.field = 'table_name'
                 
-            print(f"执行向量查询: 字段={args.field}, 查询文本='{args.query}', top_k={args.top_k}")
-            results = vector_search(collection, args.query, args.field, args.top_k)
-            print(f"向量查询结果: {results}")
-            print_results(results, "vector")
+            print(f"执行向量查询: 字段={args.field}, 查询文本={args.query}, top_k={args.top_k}")
+            batch = vector_search(service, args.query, args.field, args.top_k)
+            for query, results in zip(args.query, batch):
+                print(f"\n查询文本 '{query}' 的向量查询结果: {results}")
+                print_results(results, "vector")
+        elif args.mode == 'hybrid':
+            # 混合查询模式
+            print(f"执行混合查询: 查询文本={args.query}, top_k={args.top_k}")
+            batch = hybrid_search(service, args.query, args.top_k)
+            for query, results in zip(args.query, batch):
+                print(f"\n查询文本 '{query}' 的混合查询结果:")
+                print_results(results, "hybrid")
         else:
             # 关键词查询模式
-            print(f"执行关键词查询: 字段={args.field}, 关键词='{args.query}'")
-            results = keyword_search(collection, args.query, args.field)
-            print(f"关键词查询结果: {results}")
-            print_results(results, "keyword")
+            for keyword in args.query:
+                print(f"执行关键词查询: 字段={args.field}, 关键词='{keyword}'")
+                results = keyword_search(service, keyword, args.field)
+                print(f"关键词查询结果: {results}")
+                print_results(results, "keyword")
     
     except Exception as e:
         print(f"查询出错: {str(e)}")
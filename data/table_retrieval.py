@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pymilvus import connections, Collection, utility
+from pymilvus.exceptions import MilvusException
+from dotenv import load_dotenv
+from vector_index import TABLE_RETRIEVAL_BACKEND, OUTPUT_FIELDS, LocalVectorIndex, get_local_index
+from keyword_index import get_keyword_index
+
+try:
+    from models.embedding_client import get_embedding_client
+except ImportError:
+    # 作为脚本直接运行时，把项目根目录加入导入路径
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from models.embedding_client import get_embedding_client
+
+load_dotenv()
+
+MILVUS_HOST = os.getenv('MILVUS_HOST', '127.0.0.1')
+MILVUS_PORT = os.getenv('MILVUS_PORT', '19530')
+COLLECTION_NAME = os.getenv('MILVUS_COLLECTION_NAME', 'test')
+MILVUS_SEARCH_NPROBE = int(os.getenv('MILVUS_SEARCH_NPROBE', '10'))
+# 混合检索：倒数排名融合的平滑常数，以及每一路召回的候选数量
+HYBRID_RRF_K = int(os.getenv('HYBRID_RRF_K', '60'))
+HYBRID_CANDIDATES = int(os.getenv('HYBRID_CANDIDATES', '20'))
+
+# 专用连接别名，避免与其他脚本的 default 连接互相影响
+_ALIAS = "table_retrieval"
+
+VECTOR_FIELDS = {
+    "table_name": "table_name_embedding",
+    "table_description": "table_description_embedding",
+}
+
+
+def reciprocal_rank_fusion(ranked_lists, k=HYBRID_RRF_K, top_k=5):
+    """倒数排名融合：每路结果按 1/(k+名次) 累加得分，按表名合并。
+
+    ranked_lists: {来源名: [表记录(dict), ...]}（已按相关度排序）
+    返回 [{**表记录, "score": 融合得分, "ranks": {来源名: 名次}}]
+    """
+    fused = {}
+    for source, records in ranked_lists.items():
+        for rank, record in enumerate(records, start=1):
+            item = fused.setdefault(record["table_name"], {**record, "score": 0.0, "ranks": {}})
+            item["score"] += 1.0 / (k + rank)
+            item["ranks"][source] = rank
+    return sorted(fused.values(), key=lambda item: -item["score"])[:top_k]
+
+
+def _entity(hit):
+    return {field: hit.entity.get(field) for field in OUTPUT_FIELDS}
+
+
+def _escape(value):
+    """转义 Milvus 表达式中的字符串字面量"""
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+class TableRetrievalService:
+    """长生命周期的表检索服务。
+
+    - 只建立一次连接、只获取一次集合句柄，并记录集合的加载状态，检索时不再重复 load()；
+    - 服务端释放集合（如重启）导致检索失败时，重置状态后重新加载并重试一次；
+    - search 支持一次传入多条查询，向量化与检索各只发一次请求。
+    后端为 local 时直接使用进程内向量索引，接口相同。
+    """
+
+    def __init__(self, backend=TABLE_RETRIEVAL_BACKEND, host=MILVUS_HOST, port=MILVUS_PORT,
+                 collection_name=COLLECTION_NAME, nprobe=MILVUS_SEARCH_NPROBE):
+        self.backend = backend
+        self.host = host
+        self.port = port
+        self.collection_name = collection_name
+        self.nprobe = nprobe
+        self.collection = None
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def connect(self):
+        """建立连接并获取集合句柄（幂等）；集合不存在时抛出 RuntimeError"""
+        if self.collection is not None:
+            return self.collection
+        with self._lock:
+            if self.collection is None:
+                if self.backend == "local":
+                    self.collection = get_local_index()
+                    self.loaded = True
+                else:
+                    connections.connect(alias=_ALIAS, host=self.host, port=self.port)
+                    print("Connected to Milvus")
+                    if not utility.has_collection(self.collection_name, using=_ALIAS):
+                        raise RuntimeError(f"Collection {self.collection_name} does not exist. "
+                                           f"Please run insert_milvus.py first.")
+                    self.collection = Collection(name=self.collection_name, using=_ALIAS)
+        return self.collection
+
+    def ensure_loaded(self):
+        collection = self.connect()
+        if self.loaded:
+            return collection
+        with self._lock:
+            if not self.loaded:
+                state = utility.load_state(self.collection_name, using=_ALIAS)
+                if getattr(state, "name", str(state)) != "Loaded":
+                    collection.load()
+                self.loaded = True
+        return collection
+
+    def _call(self, fn):
+        """在已加载的集合上执行一次请求，集合被服务端释放时重新加载后重试一次"""
+        collection = self.ensure_loaded()
+        try:
+            return fn(collection)
+        except MilvusException:
+            if self.backend == "local":
+                raise
+            self.loaded = False
+            return fn(self.ensure_loaded())
+
+    def search_vectors(self, vectors, field="table_name", top_k=5):
+        """以一次请求检索多个查询向量，返回与输入对齐的命中列表"""
+        if field not in VECTOR_FIELDS:
+            raise ValueError("Invalid field for vector search. Use 'table_name' or 'table_description'")
+        anns_field = VECTOR_FIELDS[field]
+        if not vectors:
+            return []
+        if self.backend == "local":
+            return self.connect().search(vectors, anns_field, top_k)
+        search_params = {"metric_type": "L2", "params": {"nprobe": self.nprobe}}
+        results = self._call(lambda c: c.search(
+            data=list(vectors),
+            anns_field=anns_field,
+            param=search_params,
+            limit=top_k,
+            output_fields=OUTPUT_FIELDS
+        ))
+        return [results[i] for i in range(len(vectors))]
+
+    def search(self, query_texts, field="table_name", top_k=5):
+        """批量向量检索：query_texts 为单条文本或文本列表"""
+        single = isinstance(query_texts, str)
+        texts = [query_texts] if single else list(query_texts)
+        results = self.search_vectors(get_embedding_client().embed(texts), field, top_k)
+        return results[0] if single else results
+
+    def hybrid_search(self, query_texts, top_k=5, candidates=HYBRID_CANDIDATES, rrf_k=HYBRID_RRF_K):
+        """混合检索：表名向量、表描述向量与表头BM25倒排索引三路并行召回，再做倒数排名融合。
+
+        倒排索引在入库时构建，关键词召回只查询词项的倒排表，不扫描全部表头。
+        """
+        single = isinstance(query_texts, str)
+        texts = [query_texts] if single else list(query_texts)
+        keyword_index = get_keyword_index()
+        depth = max(candidates, top_k)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            keyword_future = executor.submit(lambda: [keyword_index.search(t, depth) for t in texts])
+            vectors = get_embedding_client().embed(texts)
+            vector_futures = {field: executor.submit(self.search_vectors, vectors, field, depth)
+                              for field in VECTOR_FIELDS}
+            keyword_hits = keyword_future.result()
+            vector_hits = {field: future.result() for field, future in vector_futures.items()}
+
+        results = []
+        for i in range(len(texts)):
+            ranked = {field: [_entity(hit) for hit in hits[i]] for field, hits in vector_hits.items()}
+            ranked["keyword"] = [record for _, record in keyword_hits[i]]
+            results.append(reciprocal_rank_fusion(ranked, rrf_k, top_k))
+        return results[0] if single else results
+
+    def query(self, keyword, field="headers_description"):
+        """关键词（子串）查询"""
+        if field not in OUTPUT_FIELDS:
+            raise ValueError(f"Invalid field for keyword search. Use one of {OUTPUT_FIELDS}")
+        if self.backend == "local":
+            return self.connect().query(keyword, field)
+        expr = f'{field} like "%{_escape(keyword)}%"'
+        return self._call(lambda c: c.query(expr=expr, output_fields=OUTPUT_FIELDS))
+
+    def close(self):
+        with self._lock:
+            if self.collection is not None and not isinstance(self.collection, LocalVectorIndex):
+                connections.disconnect(_ALIAS)
+            self.collection = None
+            self.loaded = False
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_retrieval_service():
+    """进程内共享的表检索服务"""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = TableRetrievalService()
+    return _service
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import re
+import csv
+import json
+import tempfile
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# 推断列类型时采样的CSV行数
+IMPORT_TYPE_SAMPLE_ROWS = int(os.getenv("IMPORT_TYPE_SAMPLE_ROWS", "1000"))
+
+# 前导零的编号（如 00123）按文本处理，避免丢失前导零
+_INTEGER = re.compile(r'^[+-]?(?:0|[1-9]\d*)$')
+_REAL = re.compile(r'^[+-]?(?:(?:0|[1-9]\d*)(?:\.\d*)?|\.\d+)(?:[eE][+-]?\d+)?$')
+_DATE = re.compile(r'^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?$')
+
+
+def _is_date(value):
+    m = _DATE.match(value)
+    return m is not None and 1 <= int(m.group(2)) <= 12 and 1 <= int(m.group(3)) <= 31
+
+
+def infer_value_type(values):
+    """根据一组非空取值推断类型：INTEGER / REAL / DATE / TEXT"""
+    if not values:
+        return None
+    if all(_INTEGER.match(v) for v in values):
+        return 'INTEGER'
+    if all(_REAL.match(v) for v in values):
+        return 'REAL'
+    if all(_is_date(v) for v in values):
+        return 'DATE'
+    return 'TEXT'
+
+
+def infer_column_types(csv_file, sample_rows=IMPORT_TYPE_SAMPLE_ROWS):
+    """采样CSV前若干行推断每列类型，返回 {列名: 类型}；整列为空的列不在结果中"""
+    with open(csv_file, 'r', encoding='utf-8', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return {}
+        samples = [[] for _ in header]
+        for i, row in enumerate(reader):
+            if i >= sample_rows:
+                break
+            if len(row) != len(header):
+                continue
+            for j, value in enumerate(row):
+                value = value.strip()
+                if value:
+                    samples[j].append(value)
+    types = {}
+    for name, values in zip(header, samples):
+        inferred = infer_value_type(values)
+        if inferred:
+            types[name] = inferred
+    return types
+
+
+def _to_date(value):
+    m = _DATE.match(value)
+    if m is None:
+        return value
+    date = f"{m.group(1)}-{int(m.group(2)):02d}-{int(m.group(3)):02d}"
+    if m.group(4) is None:
+        return date
+    return f"{date} {int(m.group(4)):02d}:{m.group(5)}:{m.group(6) or '00'}"
+
+
+def _to_int(value):
+    if not _INTEGER.match(value):
+        raise ValueError(value)
+    return int(value)
+
+
+def _to_real(value):
+    # float() 还接受 nan、inf、1_000 等写法，只转换与推断规则一致的数值
+    if not _REAL.match(value):
+        raise ValueError(value)
+    return float(value)
+
+
+_CONVERTERS = {'INTEGER': _to_int, 'REAL': _to_real, 'DATE': _to_date}
+
+
+def make_row_converter(fields, column_types):
+    """按列类型生成行转换函数：空串转为NULL，数值转为int/float，日期规范为 YYYY-MM-DD。
+
+    采样之外的行出现无法转换的取值时保留原字符串，由SQLite按列亲和性存储。
+    """
+    converters = [_CONVERTERS.get((column_types or {}).get(name)) for name in fields]
+
+    def convert(row):
+        out = []
+        for value, conv in zip(row, converters):
+            value = value.strip() if conv is not None else value
+            if value == '':
+                out.append(None)
+            elif conv is None:
+                out.append(value)
+            else:
+                try:
+                    out.append(conv(value))
+                except ValueError:
+                    out.append(value)
+        return out
+
+    return convert
+
+
+def _dump_json_atomic(path, data, indent=4):
+    """先写临时文件再替换，避免读取方（如schema注册表热加载）读到写了一半的文件"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _apply_types(fields, column_types):
+    changed = False
+    for field in fields:
+        if isinstance(field, dict) and field.get('name') in column_types:
+            if field.get('type') != column_types[field['name']]:
+                field['type'] = column_types[field['name']]
+                changed = True
+    return changed
+
+
+def write_type_sidecar(path, types_by_table):
+    """把推断出的列类型写入生成的旁路文件 {表代码: {字段: 类型}}，不改动表头JSON等源文件"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    _dump_json_atomic(path, types_by_table)
+
+
+def write_back_types(tables_json, types_by_table):
+    """把推断出的类型写入schema注册表加载的 tables.json 中对应表（按 table 或 header_ref 匹配）的 fields"""
+    if not tables_json or not os.path.exists(tables_json):
+        return
+    with open(tables_json, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    changed = False
+    for item in data.get('tables', []):
+        item_code = item.get('table') or (Path(item['header_ref']).stem if item.get('header_ref') else None)
+        if item_code in types_by_table:
+            changed = _apply_types(item.get('fields', []), types_by_table[item_code]) or changed
+    if changed:
+        _dump_json_atomic(tables_json, data)
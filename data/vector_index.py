@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import argparse
+import numpy as np
+from dotenv import load_dotenv
+from keyword_index import build_keyword_index
+
+load_dotenv()
+
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+# 表检索后端：milvus（默认）或 local（进程内NumPy索引，无需外部服务）
+TABLE_RETRIEVAL_BACKEND = os.getenv("TABLE_RETRIEVAL_BACKEND", "milvus").lower()
+# 相对路径以 data/ 目录为基准，与运行时的工作目录无关
+VECTOR_INDEX_DIR = os.path.join(DATA_DIR, os.getenv("VECTOR_INDEX_DIR", 'vector_index'))
+# flat: 精确检索；ivf: 倒排聚类后只扫描 nprobe 个簇；ivfpq: 簇内用乘积量化打分后再精确重排
+VECTOR_INDEX_MODE = os.getenv("VECTOR_INDEX_MODE", "flat").lower()
+# 聚类数，0 表示按 sqrt(行数) 自动选择
+VECTOR_INDEX_NLIST = int(os.getenv("VECTOR_INDEX_NLIST", "0"))
+VECTOR_INDEX_NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "10"))
+# 乘积量化的子空间数，需整除向量维度
+VECTOR_INDEX_PQ_M = int(os.getenv("VECTOR_INDEX_PQ_M", "16"))
+# ivfpq 模式下按量化得分取前 top_k * 该倍数 个候选做精确重排
+VECTOR_INDEX_RERANK = int(os.getenv("VECTOR_INDEX_RERANK", "4"))
+
+VECTOR_FIELDS = ["table_name_embedding", "table_description_embedding"]
+OUTPUT_FIELDS = ["table_name", "table_description", "headers_description", "example"]
+
+_META_FILE = "meta.json"
+
+
+class LocalHit:
+    """与 Milvus 检索结果一致的访问方式：hit.distance / hit.entity.get(字段)"""
+
+    def __init__(self, distance, entity):
+        self.distance = distance
+        self.entity = entity
+
+    def __repr__(self):
+        return f"LocalHit(distance={self.distance:.4f}, table_name={self.entity.get('table_name')!r})"
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _kmeans(x, k, iters=20, seed=0):
+    """球面k-means（内积相似度），返回 (质心, 每行所属簇)"""
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(x)))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    assign = np.zeros(len(x), dtype=np.int32)
+    for _ in range(iters):
+        assign = np.argmax(x @ centroids.T, axis=1).astype(np.int32)
+        for c in range(k):
+            members = x[assign == c]
+            # 空簇重新随机取一个点，避免质心退化
+            centroids[c] = members.mean(axis=0) if len(members) else x[rng.integers(len(x))]
+        centroids = _normalize(centroids)
+    return centroids, assign
+
+
+def _l2_kmeans(x, k, iters=20, seed=0):
+    """欧氏距离k-means，用于乘积量化的子空间码本"""
+    rng = np.random.default_rng(seed)
+    k = max(1, min(k, len(x)))
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    assign = np.zeros(len(x), dtype=np.int32)
+    for _ in range(iters):
+        dist = (x * x).sum(1)[:, None] - 2 * x @ centroids.T + (centroids * centroids).sum(1)[None, :]
+        assign = np.argmin(dist, axis=1).astype(np.int32)
+        for c in range(k):
+            members = x[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids, assign
+
+
+def _train_pq(x, m):
+    """把向量切成 m 段，每段训练最多256个码字，返回 (码本[m,ks,d/m], 编码[n,m])"""
+    sub_dim = x.shape[1] // m
+    codebooks, codes = [], []
+    for i in range(m):
+        part = x[:, i * sub_dim:(i + 1) * sub_dim]
+        book, assign = _l2_kmeans(part, 256, seed=i)
+        # 码字数不足256时补零，保证码本形状一致
+        padded = np.zeros((256, sub_dim), dtype=np.float32)
+        padded[:len(book)] = book
+        codebooks.append(padded)
+        codes.append(assign.astype(np.uint8))
+    return np.stack(codebooks), np.stack(codes, axis=1)
+
+
+def build_local_index(records, vectors, index_dir=VECTOR_INDEX_DIR, mode=VECTOR_INDEX_MODE,
+                      nlist=VECTOR_INDEX_NLIST, pq_m=VECTOR_INDEX_PQ_M):
+    """构建并持久化本地向量索引。
+
+    records: 每张表一条 {table_name, table_description, headers_description, example}
+    vectors: {向量字段: 与 records 对齐的向量列表}
+    向量归一化后以 .npy 保存，检索时以内存映射方式加载；表的元数据与索引参数保存在 meta.json。
+    """
+    if mode not in ("flat", "ivf", "ivfpq"):
+        raise ValueError(f"Invalid VECTOR_INDEX_MODE: {mode}. Use 'flat', 'ivf' or 'ivfpq'")
+    os.makedirs(index_dir, exist_ok=True)
+    meta = {"mode": mode, "count": len(records), "fields": {},
+            "records": [{k: r.get(k, "") for k in OUTPUT_FIELDS} for r in records]}
+
+    for field, field_vectors in vectors.items():
+        matrix = _normalize(field_vectors) if len(records) else np.zeros((0, 0), dtype=np.float32)
+        np.save(os.path.join(index_dir, f"{field}.npy"), matrix)
+        info = {"dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0}
+
+        if mode != "flat" and len(records):
+            k = nlist or max(1, int(np.sqrt(len(records))))
+            centroids, assign = _kmeans(matrix, k)
+            # 行号按簇排序后连续存放，offsets[c]:offsets[c+1] 即第 c 个簇的成员
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=len(centroids)))]).astype(np.int64)
+            np.save(os.path.join(index_dir, f"{field}.centroids.npy"), centroids)
+            np.save(os.path.join(index_dir, f"{field}.lists.npy"), order)
+            np.save(os.path.join(index_dir, f"{field}.offsets.npy"), offsets)
+            info["nlist"] = int(len(centroids))
+
+            if mode == "ivfpq":
+                if matrix.shape[1] % pq_m:
+                    raise ValueError(f"VECTOR_INDEX_PQ_M={pq_m} 不能整除向量维度 {matrix.shape[1]}")
+                codebooks, codes = _train_pq(matrix, pq_m)
+                np.save(os.path.join(index_dir, f"{field}.codebooks.npy"), codebooks)
+                np.save(os.path.join(index_dir, f"{field}.codes.npy"), codes)
+                info["pq_m"] = pq_m
+        meta["fields"][field] = info
+
+    with open(os.path.join(index_dir, _META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    print(f"本地向量索引已写入 {index_dir}: {len(records)} 张表, 模式 {mode}")
+    return LocalVectorIndex(index_dir)
+
+
+class LocalVectorIndex:
+    """进程内的表检索索引，接口与 search_table 中基于 Milvus 的 vector_search / keyword_search 对应。
+
+    距离为归一化向量之间的平方欧氏距离（= 2 - 2·余弦相似度），越小越相似。
+    """
+
+    def __init__(self, index_dir=VECTOR_INDEX_DIR, nprobe=VECTOR_INDEX_NPROBE, rerank=VECTOR_INDEX_RERANK):
+        meta_path = os.path.join(index_dir, _META_FILE)
+        if not os.path.exists(meta_path):
+            raise FileNotFoundError(f"本地向量索引不存在: {meta_path}，请先运行 insert_milvus.py 或 vector_index.py 构建")
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        self.index_dir = index_dir
+        self.mode = meta["mode"]
+        self.records = meta["records"]
+        self.nprobe = max(1, nprobe)
+        self.rerank = max(1, rerank)
+        self.fields = {}
+        for field, info in meta["fields"].items():
+            self.fields[field] = {"info": info, "matrix": self._load(f"{field}.npy")}
+            if self.mode != "flat" and self.records:
+                self.fields[field].update(
+                    centroids=self._load(f"{field}.centroids.npy"),
+                    lists=self._load(f"{field}.lists.npy"),
+                    offsets=self._load(f"{field}.offsets.npy"))
+                if self.mode == "ivfpq":
+                    self.fields[field].update(
+                        codebooks=self._load(f"{field}.codebooks.npy"),
+                        codes=self._load(f"{field}.codes.npy"))
+
+    def _load(self, name):
+        return np.load(os.path.join(self.index_dir, name), mmap_mode='r')
+
+    def __len__(self):
+        return len(self.records)
+
+    def _candidates(self, entry, q):
+        """IVF：取与查询最相近的 nprobe 个簇的全部成员行号"""
+        centroids = entry["centroids"]
+        probe = np.argsort(-(centroids @ q))[:self.nprobe]
+        offsets, lists = entry["offsets"], entry["lists"]
+        return np.concatenate([lists[offsets[c]:offsets[c + 1]] for c in probe])
+
+    def _pq_scores(self, entry, q, rows):
+        """非对称距离计算：查询每段与码字的内积查表后求和，近似 q·x"""
+        codebooks, codes = entry["codebooks"], entry["codes"]
+        m, _, sub_dim = codebooks.shape
+        tables = np.einsum('mkd,md->mk', codebooks, q.reshape(m, sub_dim))
+        return tables[np.arange(m), codes[rows]].sum(axis=1)
+
+    def search(self, query_vectors, anns_field, top_k=5):
+        """批量检索：query_vectors 为一个或多个查询向量，返回与之对齐的命中列表"""
+        if anns_field not in self.fields:
+            raise ValueError(f"Invalid field for vector search. Use one of {list(self.fields)}")
+        entry = self.fields[anns_field]
+        queries = _normalize(np.atleast_2d(query_vectors))
+        results = []
+        for q in queries:
+            if not self.records:
+                results.append([])
+                continue
+            if self.mode == "flat":
+                rows = None
+                scores = np.asarray(entry["matrix"] @ q)
+            else:
+                rows = self._candidates(entry, q)
+                if self.mode == "ivfpq" and len(rows) > top_k * self.rerank:
+                    approx = self._pq_scores(entry, q, rows)
+                    keep = np.argpartition(-approx, top_k * self.rerank)[:top_k * self.rerank]
+                    rows = np.sort(rows[keep])
+                scores = np.asarray(entry["matrix"][rows] @ q)
+            k = min(top_k, len(scores))
+            if k == 0:
+                results.append([])
+                continue
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            hits = []
+            for i in best:
+                row = int(i if rows is None else rows[i])
+                hits.append(LocalHit(float(2 - 2 * scores[i]), dict(self.records[row])))
+            results.append(hits)
+        return results
+
+    def query(self, keyword, field="headers_description"):
+        """子串匹配，语义与 Milvus 的 like "%keyword%" 一致"""
+        if field not in OUTPUT_FIELDS:
+            raise ValueError(f"Invalid field for keyword search. Use one of {OUTPUT_FIELDS}")
+        return [dict(r) for r in self.records if keyword in (r.get(field) or "")]
+
+
+_index = None
+
+
+def get_local_index(index_dir=VECTOR_INDEX_DIR):
+    """进程内共享的本地索引，只在首次使用时加载"""
+    global _index
+    if _index is None or _index.index_dir != index_dir:
+        _index = LocalVectorIndex(index_dir)
+    return _index
+
+
+def main():
+    parser = argparse.ArgumentParser(description='从 tables.json 构建本地向量索引')
+    parser.add_argument('--tables', type=str, default=os.path.join(DATA_DIR, 'table_ontology', 'tables.json'),
+                        help='表元数据JSON，格式同 insert_milvus.py 的输入')
+    parser.add_argument('--index-dir', type=str, default=VECTOR_INDEX_DIR, help='索引输出目录')
+    parser.add_argument('--mode', type=str, default=VECTOR_INDEX_MODE, choices=['flat', 'ivf', 'ivfpq'],
+                        help='索引模式')
+    args = parser.parse_args()
+
+    # 向量化客户端位于项目根目录的 models 包中
+    try:
+        from models.embedding_client import get_embedding_client
+    except ImportError:
+        import sys
+        sys.path.append(os.path.dirname(DATA_DIR))
+        from models.embedding_client import get_embedding_client
+
+    with open(args.tables, 'r', encoding='utf-8') as f:
+        records = json.load(f).get("tables", [])
+    names = [r["table_name"] for r in records]
+    descriptions = [r["table_description"] for r in records]
+    embeddings = get_embedding_client().embed(names + descriptions)
+    build_keyword_index(records)
+    build_local_index(records, {
+        "table_name_embedding": embeddings[:len(names)],
+        "table_description_embedding": embeddings[len(names):],
+    }, index_dir=args.index_dir, mode=args.mode)
+
+
+if __name__ == "__main__":
+    main()
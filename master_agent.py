@@ -1,12 +1,13 @@
 from utils.whiteboard import Whiteboard
-from models.llm import get_llm_response_gpt_4o_with_tools
+from models.llm import aget_llm_response_gpt_4o_with_tools, astream_llm_response_gpt_4o_with_tools
 # from graph.graph_match import graph_match
 # from memory.long_term_memory import experience_match
 import os
 import json
 import asyncio
 from models import llm_openai
-from tools.mcp_client import get_available_tools_async, convert_mcp_tool_to_openai, call_tool
+from tools.mcp_client import MCPSession
+from utils.async_runner import run_sync
 from utils.logger import setup_logger
 
 
@@ -45,62 +46,127 @@ master_agent_system_prompt = """
 """
 
 class MasterAgent:
-    def __init__(self, whiteboard: Whiteboard = None):
+    def __init__(self, whiteboard: Whiteboard = None, mcp_session: MCPSession = None):
         # 如果没有传入whiteboard，使用全局共享实例
         self.whiteboard = whiteboard if whiteboard is not None else Whiteboard.get_instance()
+        # agent持有长连接的MCP会话，工具目录在多轮之间缓存
+        self.mcp_session = mcp_session if mcp_session is not None else MCPSession()
 
-    def llm_step(self) -> str:
-        messages = self.whiteboard.read()
+    async def allm_step(self) -> dict:
+        messages = await self.whiteboard.aread()
         # logger.info(f"messages: {messages}")
-        mcp_tools = asyncio.run(get_available_tools_async())
-        # logger.info(f"可用工具: {mcp_tools}")
-        tools = [convert_mcp_tool_to_openai(tool.__dict__) for tool in mcp_tools]
+        tools = await self.mcp_session.list_openai_tools()
+        # logger.info(f"可用工具: {tools}")
 
         messages = [{"role": "system", "content": master_agent_system_prompt}] + messages
-        response = get_llm_response_gpt_4o_with_tools(messages, tools)
+        response = await aget_llm_response_gpt_4o_with_tools(messages, tools)
         # logger.info(f"LLM响应: {response}")
         return response
 
-    def execute_tool_calls(self, response: dict) -> dict:
+    async def astream_step(self, on_content=None) -> tuple[dict, list[dict]]:
+        """流式的一轮：边接收LLM输出边把参数已完整的工具调用提交给MCP执行。
+
+        返回 (assistant消息, 按tool_call顺序排列的工具结果消息)。
+        on_content 会逐段收到content增量，用于流式输出最终回答。
+        """
+        messages = await self.whiteboard.aread()
+        tools = await self.mcp_session.list_openai_tools()
+        messages = [{"role": "system", "content": master_agent_system_prompt}] + messages
+
+        pending: dict[str, asyncio.Task] = {}
+
+        def dispatch(tool_call: dict):
+            pending[tool_call["id"]] = asyncio.create_task(self._arun_tool_call(tool_call))
+
+        tool_results = []
+        try:
+            # 流式调用出错时，已提交的工具任务同样要在 finally 中取消
+            response = await astream_llm_response_gpt_4o_with_tools(
+                messages, tools, on_content=on_content, on_tool_call=dispatch)
+            for tool_call in response.get("tool_calls") or []:
+                task = pending.get(tool_call["id"])
+                tool_results.append(await task if task is not None else await self._arun_tool_call(tool_call))
+        finally:
+            for task in pending.values():
+                task.cancel()
+        return response, tool_results
+
+    async def _arun_tool_call(self, tool_call: dict) -> dict:
+        function_name = tool_call["function"]["name"]
+        try:
+            arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            tool_result = await self.mcp_session.call_tool(function_name, arguments)
+        except Exception as e:
+            tool_result = e
+        return self._tool_result_message(tool_call, tool_result)
+
+    @staticmethod
+    def _tool_result_message(tool_call: dict, tool_result) -> dict:
+        if isinstance(tool_result, BaseException):
+            logger.info(f"工具 {tool_call['function']['name']} 调用异常: {tool_result}")
+            tool_result = f"工具调用异常: {tool_result}"
+
+        # 构建工具调用结果消息
+        return {
+            "role": "tool",
+            "content": tool_result,
+            "tool_call_id": tool_call["id"]
+        }
+
+    async def aexecute_tool_calls(self, response: dict) -> list[dict]:
         tool_calls = response.get("tool_calls")
         tool_results = []
 
         if not tool_calls:
             return tool_results
         
-        for tool_call in tool_calls:
-            function_name = tool_call["function"]["name"]
-            arguments = json.loads(tool_call["function"]["arguments"])
-            tool_id = tool_call["id"]
-            tool_result = asyncio.run(call_tool(function_name, arguments))
-            
-            # 构建工具调用结果消息
-            tool_call_result = {
-                "role": "tool",
-                "content": tool_result,
-                "tool_call_id": tool_id
-            }
-            tool_results.append(tool_call_result)
+        # 同一轮返回的多个工具调用并发执行（受每个工具的并发上限约束），结果保持原始顺序
+        # 参数无法解析的调用直接作为该调用的异常结果，不影响其他调用
+        results = [None] * len(tool_calls)
+        calls, positions = [], []
+        for i, tool_call in enumerate(tool_calls):
+            try:
+                arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+            except json.JSONDecodeError as e:
+                results[i] = e
+                continue
+            calls.append((tool_call["function"]["name"], arguments))
+            positions.append(i)
+        for i, result in zip(positions, await self.mcp_session.call_tools(calls)):
+            results[i] = result
+
+        for tool_call, tool_result in zip(tool_calls, results):
+            tool_results.append(self._tool_result_message(tool_call, tool_result))
         
         return tool_results
     
-    def solve(self) -> str:
+    async def asolve(self, stream: bool = False, on_content=None) -> str:
+        """异步求解当前whiteboard上的问题。
+
+        LLM、MCP与whiteboard读写均为异步调用，同一事件循环中可并发运行多个
+        使用不同whiteboard的agent（可共享同一个MCPSession）。
+        stream=True 时使用流式LLM调用，工具调用在参数完整后即提前执行，content增量回调给 on_content。
+        """
         turn = 0
         final_response = None
         while turn < 50:
-            llm_result = self.llm_step()
+            if stream:
+                llm_result, tool_execution_results = await self.astream_step(on_content)
+            else:
+                llm_result, tool_execution_results = await self.allm_step(), None
             # 如果response不是工具调用，跳出循环
             if llm_result.get("role") == "assistant" and llm_result.get("content") is not None:
                 final_response = llm_result
                 break
            
-            logger.info(f"messages append: {llm_result}")
-            self.whiteboard.append(llm_result)
-            tool_execution_results = self.execute_tool_calls(llm_result)
+            if tool_execution_results is None:
+                tool_execution_results = await self.aexecute_tool_calls(llm_result)
             # logger.info(f"工具调用结果: {tool_execution_results}")
-            for result in tool_execution_results:
-                self.whiteboard.append(result)
-                logger.info(f"messages append: {result}")
+            # 助手消息与本轮全部工具结果在一个事务中写入whiteboard
+            turn_messages = [llm_result] + tool_execution_results
+            await self.whiteboard.aappend_many(turn_messages)
+            for message in turn_messages:
+                logger.info(f"messages append: {message}")
             turn += 1
 
         logger.info(f"turn: {turn}")
@@ -109,11 +175,28 @@ class MasterAgent:
         # 将最终助手消息写回whiteboard，保证多轮会话上下文完整
         logger.info(f"messages append: {final_response}")
         try:
-            self.whiteboard.append(final_response)
+            await self.whiteboard.aappend(final_response)
         except Exception as e:
             logger.info(f"append final_response failed: {e}")
         return final_response["content"]
 
+    # 同步入口：在共享的后台事件循环中运行对应的异步实现
+    def llm_step(self) -> dict:
+        return run_sync(self.allm_step())
+
+    def execute_tool_calls(self, response: dict) -> list[dict]:
+        return run_sync(self.aexecute_tool_calls(response))
+
+    def solve(self, stream: bool = False, on_content=None) -> str:
+        return run_sync(self.asolve(stream, on_content))
+
+    async def aclose(self):
+        """关闭MCP长连接"""
+        await self.mcp_session.close()
+
+    def close(self):
+        run_sync(self.aclose())
+
 def _build_priori_knowledge_payload() -> list[dict]:
     """构造预召回数据的tool消息，自动选择可用数据源，返回两条消息。"""
     
@@ -233,6 +316,7 @@ if __name__ == "__main__":
     # 交互式多轮会话
     whiteboard = Whiteboard("interactive_session")
     master_agent = MasterAgent(whiteboard)
+    stream_output = os.getenv("LLM_STREAM", "1").strip().lower() in ("1", "true", "yes", "on")
     # whiteboard.clear()
 
     print("输入你的问题，或输入 :clear 清空、:recall 注入召回、:exit 退出")
@@ -258,8 +342,7 @@ if __name__ == "__main__":
             # payload = _build_priori_knowledge_payload_with_hypergraph()
             if payload:
                 logger.info(f"messages append: {payload}")
-                whiteboard.append(payload[0])
-                whiteboard.append(payload[1])
+                whiteboard.append_many(payload)
                 print("已注入预召回数据")
                 # print(payload[0])
                 # print(payload[1])
@@ -270,5 +353,18 @@ if __name__ == "__main__":
         # 正常问答
         whiteboard.append({"role": "user", "content": query})
         logger.info(f"messages append: {{'role': 'user', 'content': '{query}'}}")
-        result = master_agent.solve()
-        print(result)
\ No newline at end of file
+        if stream_output:
+            # 最终回答逐段输出，参数完整的工具调用在模型输出期间即开始执行
+            streamed = []
+
+            def _print_delta(text):
+                streamed.append(text)
+                print(text, end="", flush=True)
+
+            result = master_agent.solve(stream=True, on_content=_print_delta)
+            print() if streamed else print(result)
+        else:
+            result = master_agent.solve()
+            print(result)
+
+    master_agent.close()
\ No newline at end of file
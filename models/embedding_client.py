@@ -0,0 +1,98 @@
+import os
+import asyncio
+import threading
+from typing import List
+from dotenv import load_dotenv, find_dotenv
+from models.http_client import get_transport
+from models.llm_cache import DiskLRUCache, canonical_hash
+from utils.async_runner import run_sync
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('embedding_client', enable_console=False)
+
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL", "http://127.0.0.1:12345/embed")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.db")
+EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("EMBEDDING_CACHE_MEMORY_ITEMS", "4096"))
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+
+class EmbeddingClient:
+    """批量、并发的向量化客户端。
+
+    - 输入文本先去重并查缓存（按服务地址+文本内容哈希），只有未命中的文本才请求服务；
+    - 未命中的文本按 batch_size 分批，最多 concurrency 个批次同时在共享连接池上请求；
+    - 返回顺序与输入一致。
+    """
+
+    def __init__(self, url: str = EMBEDDING_SERVICE_URL, batch_size: int = EMBEDDING_BATCH_SIZE,
+                 concurrency: int = EMBEDDING_CONCURRENCY, cache: DiskLRUCache | None = None):
+        self.url = url
+        self.batch_size = max(1, batch_size)
+        self.concurrency = max(1, concurrency)
+        self.cache = cache
+        self._transport = get_transport("embedding")
+        self.requests = 0
+
+    def _key(self, text: str) -> str:
+        return canonical_hash({"url": self.url, "text": text})
+
+    async def _embed_batch(self, texts: List[str], semaphore: asyncio.Semaphore) -> List[List[float]]:
+        async with semaphore:
+            self.requests += 1
+            response = await self._transport.apost(self.url, json={"texts": texts})
+        if response.status_code != 200:
+            raise Exception(f"Embedding service error: {response.text}")
+        vectors = response.json()
+        if len(vectors) != len(texts):
+            raise Exception(f"Embedding service error: 请求 {len(texts)} 条文本，返回 {len(vectors)} 条向量")
+        return vectors
+
+    async def aembed(self, texts: List[str]) -> List[List[float]]:
+        result = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            cached = self.cache.get(self._key(text)) if self.cache is not None else None
+            if cached is not None:
+                result[text] = cached
+            else:
+                missing.append(text)
+
+        if missing:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            batches = [missing[i:i + self.batch_size] for i in range(0, len(missing), self.batch_size)]
+            outputs = await asyncio.gather(*(self._embed_batch(batch, semaphore) for batch in batches))
+            for batch, vectors in zip(batches, outputs):
+                for text, vector in zip(batch, vectors):
+                    result[text] = vector
+                    if self.cache is not None:
+                        self.cache.set(self._key(text), vector)
+            logger.info(f"向量化 {len(texts)} 条文本: 缓存命中 {len(result) - len(missing)}, 请求 {len(batches)} 批")
+        return [result[text] for text in texts]
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """同步接口：在后台事件循环中并发请求"""
+        if not texts:
+            return []
+        return run_sync(self.aembed(list(texts)))
+
+    def embed_one(self, text: str) -> List[float]:
+        return self.embed([text])[0]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_embedding_client() -> EmbeddingClient:
+    """进程内共享的向量化客户端，带磁盘缓存"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                cache = DiskLRUCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MEMORY_ITEMS, EMBEDDING_CACHE_MAX_BYTES)
+                _client = EmbeddingClient(cache=cache)
+    return _client
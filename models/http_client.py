@@ -0,0 +1,258 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+import httpx
+from dotenv import load_dotenv, find_dotenv
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('http_client', enable_console=False)
+
+# 传输层配置在模块加载时读取一次
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "120"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "3"))
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "20"))
+HTTP_BREAKER_THRESHOLD = int(os.getenv("HTTP_BREAKER_THRESHOLD", "5"))
+HTTP_BREAKER_RESET = float(os.getenv("HTTP_BREAKER_RESET", "30"))
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+class CircuitBreaker:
+    """连续失败达到阈值后熔断，冷却期过后放行一个探测请求（half-open），成功则恢复"""
+
+    def __init__(self, failure_threshold: int = HTTP_BREAKER_THRESHOLD, reset_timeout: float = HTTP_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                raise CircuitOpenError(f"熔断中，{self.reset_timeout}s 冷却期内拒绝请求")
+            self._probing = True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                logger.warning(f"连续失败 {self._failures} 次，熔断器打开")
+            self._probing = False
+
+
+def _retry_after_seconds(response: httpx.Response | None) -> float | None:
+    """解析 Retry-After 头（秒数或HTTP日期）"""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class HttpTransport:
+    """带连接池、超时、重试和熔断的共享HTTP传输层。
+
+    - 同步请求复用一个 httpx.Client（keep-alive连接池）；异步请求按事件循环各复用一个 httpx.AsyncClient。
+    - 对 429/5xx 及网络错误按指数退避+全抖动重试，优先遵循服务端的 Retry-After。
+    - 重试耗尽后返回最后一次响应（或抛出最后一次异常），由调用方按原有方式处理错误。
+    """
+
+    def __init__(self, headers: dict | None = None, timeout: float = HTTP_TIMEOUT,
+                 connect_timeout: float = HTTP_CONNECT_TIMEOUT, max_retries: int = HTTP_MAX_RETRIES,
+                 pool_size: int = HTTP_POOL_SIZE, breaker: CircuitBreaker | None = None):
+        self.headers = dict(headers or {})
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        self.max_retries = max_retries
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._client = None
+        self._async_clients: dict = {}
+        self._lock = threading.Lock()
+
+    def _sync_client(self) -> httpx.Client:
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = httpx.Client(headers=self.headers, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    def _async_client(self) -> httpx.AsyncClient:
+        # 异步客户端的连接绑定在事件循环上，按循环各自复用一个
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None or client.is_closed:
+            for stale in [l for l in self._async_clients if l.is_closed()]:
+                self._async_clients.pop(stale, None)
+            client = self._async_clients[loop] = httpx.AsyncClient(
+                headers=self.headers, timeout=self.timeout, limits=self.limits)
+        return client
+
+    def _backoff(self, attempt: int, response: httpx.Response | None) -> float:
+        retry_after = _retry_after_seconds(response)
+        if retry_after is not None:
+            return min(retry_after, HTTP_BACKOFF_MAX)
+        return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * (2 ** attempt)))
+
+    def _should_retry(self, attempt: int, response: httpx.Response | None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRY_STATUS
+
+    def _finish(self, response: httpx.Response | None):
+        if response is not None and response.status_code < 500 and response.status_code != 429:
+            self.breaker.record_success()
+        else:
+            self.breaker.record_failure()
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        self.breaker.allow()
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                response, error = None, None
+                try:
+                    response = self._sync_client().post(url, **kwargs)
+                except httpx.TransportError as e:
+                    error = e
+                if not self._should_retry(attempt, response) or (response is not None and response.status_code < 400):
+                    settled = True
+                    self._finish(response)
+                    if error is not None:
+                        raise error
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.info(f"请求 {url} 失败({response.status_code if response is not None else error})，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+                attempt += 1
+        except BaseException:
+            # 任何未预期的异常（包括取消）都要结算熔断状态，否则 half-open 探测标记会一直保留
+            if not settled:
+                self._finish(None)
+            raise
+
+    async def apost(self, url: str, **kwargs) -> httpx.Response:
+        self.breaker.allow()
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                response, error = None, None
+                try:
+                    response = await self._async_client().post(url, **kwargs)
+                except httpx.TransportError as e:
+                    error = e
+                if not self._should_retry(attempt, response) or (response is not None and response.status_code < 400):
+                    settled = True
+                    self._finish(response)
+                    if error is not None:
+                        raise error
+                    return response
+                delay = self._backoff(attempt, response)
+                logger.info(f"请求 {url} 失败({response.status_code if response is not None else error})，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                await asyncio.sleep(delay)
+                attempt += 1
+        except BaseException:
+            # 任何未预期的异常（包括取消）都要结算熔断状态，否则 half-open 探测标记会一直保留
+            if not settled:
+                self._finish(None)
+            raise
+
+    async def astream(self, url: str, **kwargs) -> httpx.Response:
+        """发起流式POST请求，返回响应头已到达、响应体尚未读取的响应，调用方负责 aclose()。
+
+        重试只发生在响应体开始传输之前。
+        """
+        self.breaker.allow()
+        settled = False
+        try:
+            attempt = 0
+            while True:
+                response, error = None, None
+                try:
+                    client = self._async_client()
+                    response = await client.send(client.build_request("POST", url, **kwargs), stream=True)
+                except httpx.TransportError as e:
+                    error = e
+                if not self._should_retry(attempt, response) or (response is not None and response.status_code < 400):
+                    settled = True
+                    self._finish(response)
+                    if error is not None:
+                        raise error
+                    return response
+                if response is not None:
+                    await response.aclose()
+                delay = self._backoff(attempt, response)
+                logger.info(f"请求 {url} 失败({response.status_code if response is not None else error})，{delay:.2f}s 后第 {attempt + 1} 次重试")
+                await asyncio.sleep(delay)
+                attempt += 1
+        except BaseException:
+            # 任何未预期的异常（包括取消）都要结算熔断状态，否则 half-open 探测标记会一直保留
+            if not settled:
+                self._finish(None)
+            raise
+
+    def close(self):
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self):
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+
+_transports: dict[str, HttpTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(name: str, headers: dict | None = None) -> HttpTransport:
+    """按名称获取进程内共享的传输层实例（如 "llm"），首次获取时创建"""
+    transport = _transports.get(name)
+    if transport is None:
+        with _transports_lock:
+            transport = _transports.get(name)
+            if transport is None:
+                transport = _transports[name] = HttpTransport(headers=headers)
+    return transport
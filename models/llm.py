@@ -1,35 +1,67 @@
-import requests
 import json
 import os
 from dotenv import load_dotenv, find_dotenv
 from utils.logger import setup_logger
+from models.http_client import get_transport
+from models.llm_cache import get_llm_cache, llm_cache_key
 
 load_dotenv(find_dotenv())
 
 # 初始化logger，统一通过utils.logger控制控制台开关
 logger = setup_logger('llm', enable_console=False)
 
-def get_llm_response_gpt_4o(messages):
-    LLM_URL = os.getenv("BASE_URL", "https://api.apiyi.com/v1") + "/chat/completions"
-    HEADERS = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('TOKEN', '')}"
-    }
+# 模型服务配置在模块加载时读取一次
+LLM_URL = os.getenv("BASE_URL", "https://api.apiyi.com/v1") + "/chat/completions"
+MODEL_NAME = os.getenv("MODEL_NAME", "gpt-4o")
+TEMPERATURE = os.getenv("TEMPERATURE")
+MAX_TOKENS = int(os.getenv("MAX_TOKENS", 2000))
+
+# 所有LLM请求共用一个带连接池、重试和熔断的传输层
+_transport = get_transport("llm", headers={
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {os.getenv('TOKEN', '')}"
+})
+
+def _temperature(default: float) -> float:
+    return float(TEMPERATURE) if TEMPERATURE is not None else default
+
+def _cache_lookup(payload, use_cache):
+    """按调用方选择启用缓存：返回 (缓存键, 命中结果)，未启用时缓存键为None"""
+    if not use_cache:
+        return None, None
+    key = llm_cache_key(payload)
+    cached = get_llm_cache().get(key)
+    if cached is not None:
+        logger.info(f"LLM缓存命中: {key}")
+    return key, cached
+
+def get_llm_response_gpt_4o(messages, temperature=None, use_cache=False):
+    """普通LLM调用。
+
+    temperature 为空时使用环境变量配置；use_cache=True 时相同的模型、消息和温度直接返回缓存结果，
+    适合temperature=0等确定性的步骤。
+    """
     payload = {
-        "model": os.getenv("MODEL_NAME", "gpt-4o"),
+        "model": MODEL_NAME,
         "messages": messages,
-        "temperature": float(os.getenv("TEMPERATURE", 0.7)),
-        "max_tokens": int(os.getenv("MAX_TOKENS", 2000))
+        "temperature": _temperature(0.7) if temperature is None else temperature,
+        "max_tokens": MAX_TOKENS
     }
+    cache_key, cached = _cache_lookup(payload, use_cache)
+    if cached is not None:
+        return cached
     try:
         logger.info(f"LLM请求 payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
-        response = requests.post(LLM_URL, headers=HEADERS, json=payload)
+        response = _transport.post(LLM_URL, json=payload)
         logger.info(f"LLM响应: {response.status_code}")
         logger.info(f"LLM响应详情: {response.text}")
         if response.status_code == 200:
             result = response.json()
             logger.info("LLM API调用成功")
-            return result['choices'][0]['message']['content']
+            content = result['choices'][0]['message']['content']
+            if cache_key is not None:
+                get_llm_cache().set(cache_key, content)
+            return content
         else:
             logger.error(f"LLM调用失败: {response.status_code} - {response.text}")
             return f"LLM调用失败: {response.status_code} - {response.text}"
@@ -39,17 +71,12 @@ def get_llm_response_gpt_4o(messages):
 
 def get_llm_response_with_function_call(messages, functions=None):
     """使用function call功能的LLM调用"""
-    LLM_URL = os.getenv("BASE_URL", "https://api.apiyi.com/v1") + "/chat/completions"
-    HEADERS = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('TOKEN', '')}"
-    }
     
     payload = {
-        "model": os.getenv("MODEL_NAME", "gpt-4o"),
+        "model": MODEL_NAME,
         "messages": messages,
-        "temperature": float(os.getenv("TEMPERATURE", 0.1)),
-        "max_tokens": int(os.getenv("MAX_TOKENS", 2000))
+        "temperature": _temperature(0.1),
+        "max_tokens": MAX_TOKENS
     }
     if functions:
         payload["functions"] = functions
@@ -57,7 +84,7 @@ def get_llm_response_with_function_call(messages, functions=None):
     
     try:
         logger.info(f"LLM请求 payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
-        response = requests.post(LLM_URL, headers=HEADERS, json=payload)
+        response = _transport.post(LLM_URL, json=payload)
         logger.info(f"LLM响应: {response.status_code}")
         logger.info(f"LLM响应详情: {response.text}")
         if response.status_code == 200:
@@ -74,32 +101,37 @@ def get_llm_response_with_function_call(messages, functions=None):
             "function_call": None
         }
 
-def get_llm_response_gpt_4o_with_tools(messages, tools=None):
-    """使用tools功能的LLM调用"""    
-    LLM_URL = os.getenv("BASE_URL", "https://api.apiyi.com/v1") + "/chat/completions"
-    HEADERS = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {os.getenv('TOKEN', '')}"
-    }
-    
+def _build_tools_payload(messages, tools=None):
     payload = {
-        "model": os.getenv("MODEL_NAME", "gpt-4o"),
+        "model": MODEL_NAME,
         "messages": messages,
-        "temperature": float(os.getenv("TEMPERATURE", 0.1)),
-        "max_tokens": int(os.getenv("MAX_TOKENS", 2000))
+        "temperature": _temperature(0.1),
+        "max_tokens": MAX_TOKENS
     }
     if tools:
         payload["tools"] = tools
         payload["tool_choice"] = "auto"
+    return payload
+
+def get_llm_response_gpt_4o_with_tools(messages, tools=None, use_cache=False):
+    """使用tools功能的LLM调用"""    
+    
+    payload = _build_tools_payload(messages, tools)
+    cache_key, cached = _cache_lookup(payload, use_cache)
+    if cached is not None:
+        return cached
     
     try:
         logger.info(f"LLM请求 payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
-        response = requests.post(LLM_URL, headers=HEADERS, json=payload)
+        response = _transport.post(LLM_URL, json=payload)
         logger.info(f"LLM响应: {response.status_code}")
         logger.info(f"LLM响应详情: {response.text}")
         if response.status_code == 200:
             result = response.json()
-            return result['choices'][0]['message']
+            message = result['choices'][0]['message']
+            if cache_key is not None:
+                get_llm_cache().set(cache_key, message)
+            return message
         else:
             return {
                 "content": f"LLM调用失败: {response.status_code} - {response.text}",
@@ -111,7 +143,127 @@ def get_llm_response_gpt_4o_with_tools(messages, tools=None):
             "tool_calls": None
         }
 
+async def aget_llm_response_gpt_4o_with_tools(messages, tools=None, use_cache=False):
+    """get_llm_response_gpt_4o_with_tools 的异步版本，等待响应期间不占用线程"""
+
+    payload = _build_tools_payload(messages, tools)
+    cache_key, cached = _cache_lookup(payload, use_cache)
+    if cached is not None:
+        return cached
 
+    try:
+        logger.info(f"LLM请求 payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+        response = await _transport.apost(LLM_URL, json=payload)
+        logger.info(f"LLM响应: {response.status_code}")
+        logger.info(f"LLM响应详情: {response.text}")
+        if response.status_code == 200:
+            result = response.json()
+            message = result['choices'][0]['message']
+            if cache_key is not None:
+                get_llm_cache().set(cache_key, message)
+            return message
+        else:
+            return {
+                "content": f"LLM调用失败: {response.status_code} - {response.text}",
+                "tool_calls": None
+            }
+    except Exception as e:
+        return {
+            "content": f"LLM调用异常: {str(e)}",
+            "tool_calls": None
+        }
+
+def _tool_call_arguments_complete(arguments: str) -> bool:
+    """判断流式累积的arguments是否已是完整的JSON对象"""
+    text = arguments.strip()
+    if not text.endswith("}"):
+        return False
+    try:
+        return isinstance(json.loads(text), dict)
+    except json.JSONDecodeError:
+        return False
+
+async def astream_llm_response_gpt_4o_with_tools(messages, tools=None, on_content=None, on_tool_call=None):
+    """流式的tools调用，返回值与 get_llm_response_gpt_4o_with_tools 相同（完整的assistant消息）。
+
+    - on_content(text): 每收到一段content增量时回调，可用于逐字输出最终回答。
+    - on_tool_call(tool_call): 某个工具调用的arguments拼接成完整JSON时立即回调（此时模型可能仍在输出后续调用），
+      流结束时尚未回调过的工具调用也会补发，每个工具调用只回调一次。
+    """
+    payload = _build_tools_payload(messages, tools)
+    payload["stream"] = True
+
+    content_parts = []
+    tool_calls: dict[int, dict] = {}
+    dispatched = set()
+
+    def _dispatch(index: int):
+        if index in dispatched or on_tool_call is None:
+            return
+        dispatched.add(index)
+        on_tool_call(tool_calls[index])
+
+    try:
+        logger.info(f"LLM流式请求 payload: {json.dumps(payload, ensure_ascii=False, indent=2)}")
+        response = await _transport.astream(LLM_URL, json=payload)
+        try:
+            logger.info(f"LLM响应: {response.status_code}")
+            if response.status_code != 200:
+                await response.aread()
+                return {
+                    "content": f"LLM调用失败: {response.status_code} - {response.text}",
+                    "tool_calls": None
+                }
+            async for line in response.aiter_lines():
+                line = line.strip()
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                chunk = json.loads(data)
+                if not chunk.get("choices"):
+                    continue
+                delta = chunk["choices"][0].get("delta") or {}
+                if delta.get("content"):
+                    content_parts.append(delta["content"])
+                    if on_content is not None:
+                        on_content(delta["content"])
+                for tc in delta.get("tool_calls") or []:
+                    index = tc.get("index", 0)
+                    # 出现新的工具调用时，之前的调用必然已输出完整
+                    for prev in [i for i in tool_calls if i < index]:
+                        _dispatch(prev)
+                    call = tool_calls.setdefault(index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+                    if tc.get("id"):
+                        call["id"] = tc["id"]
+                    fn = tc.get("function") or {}
+                    if fn.get("name"):
+                        call["function"]["name"] += fn["name"]
+                    if fn.get("arguments"):
+                        if index in dispatched:
+                            logger.warning(f"工具调用 {call['id']} 已提前分发，但仍收到arguments增量")
+                        call["function"]["arguments"] += fn["arguments"]
+                    if call["id"] and call["function"]["name"] and _tool_call_arguments_complete(call["function"]["arguments"]):
+                        _dispatch(index)
+        finally:
+            await response.aclose()
+    except Exception as e:
+        return {
+            "content": f"LLM调用异常: {str(e)}",
+            "tool_calls": None
+        }
+
+    for index in sorted(tool_calls):
+        _dispatch(index)
+    message = {
+        "role": "assistant",
+        "content": "".join(content_parts) or None,
+    }
+    if tool_calls:
+        message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+    logger.info(f"LLM流式响应: {json.dumps(message, ensure_ascii=False)}")
+    return message
 
 
 if __name__ == "__main__":
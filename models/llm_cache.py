@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv, find_dotenv
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('llm_cache', enable_console=False)
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "llm_cache.db")
+LLM_CACHE_MEMORY_ITEMS = int(os.getenv("LLM_CACHE_MEMORY_ITEMS", "1024"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def canonical_hash(obj) -> str:
+    """对可JSON序列化对象做规范化（键排序、紧凑分隔符）后取sha256"""
+    text = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DiskLRUCache:
+    """内存LRU + SQLite磁盘存储的键值缓存，value为可JSON序列化对象。
+
+    - 内存层按条目数做LRU淘汰；磁盘层按总字节数淘汰最久未访问的条目。
+    - 超过TTL的条目视为未命中并被删除。
+    - hits/misses 等计数可通过 stats() 获取。
+    """
+
+    def __init__(self, path: str, max_memory_items: int = 1024, max_disk_bytes: int = 256 * 1024 * 1024,
+                 ttl: float | None = None):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._memory: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.memory_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_entries_accessed ON cache_entries(accessed_at)")
+        self._conn.commit()
+        self._disk_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return self.ttl is not None and now - created_at > self.ttl
+
+    def _remember(self, key: str, created_at: float, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[0], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    self.memory_hits += 1
+                    return entry[1]
+                self._delete(key)
+                self.misses += 1
+                return None
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self._expired(row[1], now):
+                self._delete(key)
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE cache_entries SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value):
+        serialized = json.dumps(value, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM cache_entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized, size, now, now)
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._evict_disk()
+            self._conn.commit()
+            self._remember(key, now, value)
+
+    def _delete(self, key: str):
+        self._memory.pop(key, None)
+        row = self._conn.execute("SELECT size FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+            self._conn.commit()
+            self._disk_bytes -= row[0]
+
+    def _evict_disk(self):
+        """先清理过期条目，仍超出容量时按最久未访问淘汰"""
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        if self.ttl is not None:
+            cutoff = time.time() - self.ttl
+            expired = self._conn.execute(
+                "SELECT key, size FROM cache_entries WHERE created_at < ?", (cutoff,)).fetchall()
+            self._drop_rows(expired)
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        cursor = self._conn.execute("SELECT key, size FROM cache_entries ORDER BY accessed_at ASC")
+        victims = []
+        freed = 0
+        for key, size in cursor:
+            if self._disk_bytes - freed <= self.max_disk_bytes:
+                break
+            victims.append((key, size))
+            freed += size
+        self._drop_rows(victims)
+
+    def _drop_rows(self, rows):
+        if not rows:
+            return
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", [(k,) for k, _ in rows])
+        for key, size in rows:
+            self._memory.pop(key, None)
+            self._disk_bytes -= size
+        self.evictions += len(rows)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._conn.execute("DELETE FROM cache_entries")
+            self._conn.commit()
+            self._disk_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "memory_hits": self.memory_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "memory_items": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache() -> DiskLRUCache:
+    """LLM响应缓存（进程内单例，首次使用时创建）"""
+    global _llm_cache
+    if _llm_cache is None:
+        with _llm_cache_lock:
+            if _llm_cache is None:
+                _llm_cache = DiskLRUCache(LLM_CACHE_PATH, LLM_CACHE_MEMORY_ITEMS, LLM_CACHE_MAX_BYTES, LLM_CACHE_TTL)
+    return _llm_cache
+
+
+def llm_cache_key(payload: dict) -> str:
+    """以模型、消息、工具定义和温度计算缓存键"""
+    return canonical_hash({
+        "model": payload.get("model"),
+        "messages": payload.get("messages"),
+        "tools": payload.get("tools") or payload.get("functions"),
+        "temperature": payload.get("temperature"),
+    })
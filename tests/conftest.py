@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 与脚本运行方式一致：项目根目录下的包按包导入，data/ 下的脚本互相按模块名导入
+for path in (ROOT, os.path.join(ROOT, "data")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
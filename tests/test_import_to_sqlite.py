@@ -0,0 +1,56 @@
+import sqlite3
+
+import pytest
+
+from import_to_sqlite import STAGING_PREFIX, bulk_import
+
+FIELDS = ["id", "name"]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "t.db"))
+    conn.execute("CREATE TABLE items (id TEXT, name TEXT, PRIMARY KEY (id))")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _write_csv(path, rows, trailer=b""):
+    body = "\n".join(",".join(row) for row in [FIELDS] + rows) + "\n"
+    path.write_bytes(body.encode("utf-8") + trailer)
+    return str(path)
+
+
+def _tables(conn):
+    return sorted(r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'"))
+
+
+def test_full_import_replaces_previous_rows(conn, tmp_path):
+    bulk_import(conn, [(_write_csv(tmp_path / "v1.csv", [["1", "a"], ["2", "b"]]), "items", FIELDS, None, None)],
+                workers=1)
+    stats = bulk_import(conn, [(_write_csv(tmp_path / "v2.csv", [["3", "c"]]), "items", FIELDS, None, None)],
+                        workers=1)
+    assert stats["items"]["rows"] == 1
+    assert conn.execute("SELECT id, name FROM items").fetchall() == [("3", "c")]
+    # 换入的表保留原表的主键定义
+    assert "PRIMARY KEY" in conn.execute("SELECT sql FROM sqlite_master WHERE name = 'items'").fetchone()[0]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_failed_reimport_keeps_previous_rows(conn, tmp_path, workers):
+    previous = [[str(i), "old"] for i in range(10)]
+    bulk_import(conn, [(_write_csv(tmp_path / "old.csv", previous), "items", FIELDS, None, None)], workers=1)
+
+    conn.execute("CREATE TABLE other (id TEXT, name TEXT)")
+    conn.commit()
+    # 坏字节位于文件末尾：出错前已有多个数据块写入并提交
+    bad = _write_csv(tmp_path / "bad.csv", [[str(i), "new"] for i in range(5000)], trailer=b"9999,\xff\xfe\n")
+    good = _write_csv(tmp_path / "good.csv", [["x", "y"]])
+    stats = bulk_import(conn, [(bad, "items", FIELDS, None, None), (good, "other", FIELDS, None, None)],
+                        workers=workers, chunk_rows=100, commit_rows=200)
+
+    assert "error" in stats["items"]
+    assert conn.execute("SELECT count(*), min(name), max(name) FROM items").fetchone() == (10, "old", "old")
+    assert conn.execute("SELECT id, name FROM other").fetchall() == [("x", "y")]
+    assert not [t for t in _tables(conn) if t.startswith(STAGING_PREFIX)]
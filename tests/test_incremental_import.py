@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from import_to_sqlite import bulk_import
+from incremental_import import ChangeTracker, file_checksum
+
+FIELDS = ["id", "name", "qty"]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "t.db"))
+    conn.execute("CREATE TABLE items (id TEXT, name TEXT, qty INTEGER, PRIMARY KEY (id))")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def _write_csv(path, rows):
+    path.write_text("\n".join(",".join(row) for row in [FIELDS] + rows) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def _import(conn, tracker, csv_file, key_fields=("id",)):
+    """按 import_to_sqlite.main 的流程对一张表做一次增量导入，返回该表的变更记录"""
+    checksum = file_checksum(csv_file)
+    if tracker.is_unchanged("items", checksum):
+        return tracker.tables["items"]
+    tracker.begin_table("items", csv_file, checksum, list(key_fields))
+    conn.commit()
+    bulk_import(conn, [(csv_file, "items", FIELDS, {"qty": "INTEGER"}, list(key_fields))], workers=1, tracker=tracker)
+    return tracker.tables["items"]
+
+
+def _rows(conn):
+    return conn.execute("SELECT id, name, qty FROM items ORDER BY id").fetchall()
+
+
+def test_first_import_inserts_every_row(conn, tmp_path):
+    csv_file = _write_csv(tmp_path / "items.csv", [["1", "a", "10"], ["2", "b", "20"], ["3", "c", "30"]])
+    entry = _import(conn, ChangeTracker(conn), csv_file)
+    assert entry["status"] == "new"
+    assert (entry["inserted"], entry["updated"], entry["deleted"]) == (3, 0, 0)
+    assert _rows(conn) == [("1", "a", 10), ("2", "b", 20), ("3", "c", 30)]
+
+
+def test_reimport_counts_inserts_updates_and_deletes(conn, tmp_path):
+    _import(conn, ChangeTracker(conn), _write_csv(tmp_path / "v1.csv",
+                                                  [["1", "a", "10"], ["2", "b", "20"], ["3", "c", "30"]]))
+    tracker = ChangeTracker(conn)
+    entry = _import(conn, tracker, _write_csv(tmp_path / "v2.csv",
+                                              [["1", "a", "10"], ["2", "b", "25"], ["4", "d", "40"]]))
+    assert entry["status"] == "changed"
+    assert (entry["inserted"], entry["updated"], entry["deleted"]) == (1, 1, 1)
+    assert sorted(entry["changed_keys"]) == [["2"], ["4"]]
+    assert entry["deleted_keys"] == [["3"]]
+    assert _rows(conn) == [("1", "a", 10), ("2", "b", 25), ("4", "d", 40)]
+    assert tracker.summary()["changed_tables"] == ["items"]
+
+
+def test_unchanged_file_is_skipped(conn, tmp_path):
+    csv_file = _write_csv(tmp_path / "items.csv", [["1", "a", "10"]])
+    _import(conn, ChangeTracker(conn), csv_file)
+    tracker = ChangeTracker(conn)
+    entry = _import(conn, tracker, csv_file)
+    assert entry == {"status": "unchanged", "inserted": 0, "updated": 0, "deleted": 0}
+    assert tracker.summary()["changed_tables"] == []
+
+
+def test_table_without_primary_key_is_reloaded(conn, tmp_path):
+    _import(conn, ChangeTracker(conn), _write_csv(tmp_path / "v1.csv", [["1", "a", "10"], ["2", "b", "20"]]),
+            key_fields=())
+    entry = _import(conn, ChangeTracker(conn), _write_csv(tmp_path / "v2.csv", [["1", "a", "11"]]), key_fields=())
+    assert entry["status"] == "reloaded"
+    assert (entry["inserted"], entry["deleted"]) == (1, 2)
+    assert _rows(conn) == [("1", "a", 11)]
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from tools import sql_plan_cache
+from tools.schema_registry import SchemaRegistry
+from tools.sql_plan_cache import SQLPlanCache, extract_literals, parameterize, render_sql
+
+TABLES = ["合同"]
+QUERY = "查询合同编号为SCJSD20231226-SCGLB01且金额大于100的合同"
+SQL = "SELECT \"合同编号\", \"金额\" FROM sales_contract WHERE \"合同编号\" = 'SCJSD20231226-SCGLB01' AND \"金额\" > 100"
+TEMPLATE = "SELECT \"合同编号\", \"金额\" FROM sales_contract WHERE \"合同编号\" = ? AND \"金额\" > ?"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    tables_json = tmp_path / "tables.json"
+    tables_json.write_text(json.dumps({"tables": [{"table_name": "合同", "table": "sales_contract"}]},
+                                      ensure_ascii=False), encoding="utf-8")
+    registry = SchemaRegistry(str(tables_json), str(tmp_path / "relations.json"))
+    monkeypatch.setattr(sql_plan_cache, "get_schema_registry", lambda: registry)
+    return SQLPlanCache()
+
+
+def test_extract_literals_same_shape_for_different_literals():
+    shape, literals = extract_literals(QUERY)
+    other_shape, other_literals = extract_literals("查询合同编号为“HT-2024-007”且金额大于2500.5的合同")
+    assert literals == ["SCJSD20231226-SCGLB01", "100"]
+    assert other_literals == ["HT-2024-007", "2500.5"]
+    assert shape == other_shape
+
+
+def test_extract_literals_keeps_plain_words():
+    shape, literals = extract_literals("查询SAP系统中编号为A001的订单")
+    assert literals == ["A001"]
+    assert "sap" in shape
+
+
+def test_parameterize_replaces_string_and_numeric_literals():
+    template, params = parameterize(SQL, ["SCJSD20231226-SCGLB01", "100"])
+    assert template == TEMPLATE
+    assert params == [(0, False), (1, True)]
+
+
+def test_parameterize_rejects_literal_missing_from_sql():
+    assert parameterize("SELECT * FROM sales_contract", ["SCJSD20231226-SCGLB01"]) is None
+
+
+def test_parameterize_rejects_duplicate_literals():
+    sql = "SELECT * FROM t WHERE a = 'A1' OR b = 'A1'"
+    assert parameterize(sql, ["A1", "A1"]) is None
+
+
+def test_render_sql_quotes_strings():
+    assert render_sql("SELECT * FROM t WHERE a = ? AND b > ?", ["O'Neil", 5]) == \
+        "SELECT * FROM t WHERE a = 'O''Neil' AND b > 5"
+
+
+def test_cached_plan_is_reused_with_new_literals(cache):
+    assert cache.store(TABLES, QUERY, SQL)
+    hit = cache.lookup(["sales_contract"], "查询合同编号为HT-2024-007且金额大于2500.5的合同")
+    assert hit == (TEMPLATE, ["HT-2024-007", 2500.5])
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 1}
+
+
+def test_lookup_misses_for_different_shape(cache):
+    cache.store(TABLES, QUERY, SQL)
+    assert cache.lookup(TABLES, "查询合同编号为HT-2024-007的合同的签订日期") is None
+
+
+def test_lookup_rejects_non_numeric_value_in_numeric_slot(cache):
+    cache.store(TABLES, QUERY, SQL)
+    assert cache.lookup(TABLES, "查询合同编号为HT-2024-007且金额大于10k的合同") is None
+
+
+def test_unparameterizable_sql_is_not_stored(cache):
+    assert not cache.store(TABLES, QUERY, "SELECT * FROM sales_contract")
+    assert cache.lookup(TABLES, QUERY) is None
@@ -0,0 +1,42 @@
+import pytest
+
+from type_inference import infer_column_types, infer_value_type, make_row_converter
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["1", "-2", "+30"], "INTEGER"),
+    (["1.5", "2", "3e4", ".5"], "REAL"),
+    (["2023-12-26", "2024/1/5", "2024-01-05 08:30"], "DATE"),
+    (["00123", "00456"], "TEXT"),
+    (["1", "007"], "TEXT"),
+    (["0.5", "01.5"], "TEXT"),
+    (["nan", "1.0"], "TEXT"),
+    (["inf"], "TEXT"),
+    (["1_000"], "TEXT"),
+    (["0x1F"], "TEXT"),
+    ([], None),
+])
+def test_infer_value_type(values, expected):
+    assert infer_value_type(values) == expected
+
+
+def test_infer_column_types_from_csv(tmp_path):
+    csv_file = tmp_path / "t.csv"
+    csv_file.write_text("编号,数量,单价,日期,备注\n"
+                        "00123,1,2.5,2023-12-26,\n"
+                        "00456,20,3,2024-01-05,\n", encoding="utf-8")
+    assert infer_column_types(str(csv_file)) == {
+        "编号": "TEXT", "数量": "INTEGER", "单价": "REAL", "日期": "DATE"}
+
+
+def test_converter_keeps_strings_that_do_not_match_the_column_type():
+    convert = make_row_converter(["id", "qty", "price"], {"qty": "INTEGER", "price": "REAL"})
+    assert convert(["00123", "007", "nan"]) == ["00123", "007", "nan"]
+    assert convert(["00123", "1_000", "inf"]) == ["00123", "1_000", "inf"]
+    assert convert(["00123", " 42 ", "1e3"]) == ["00123", 42, 1000.0]
+
+
+def test_converter_empty_values_become_null_and_dates_are_normalized():
+    convert = make_row_converter(["d", "note"], {"d": "DATE"})
+    assert convert(["2024/1/5", ""]) == ["2024-01-05", None]
+    assert convert(["2024-1-5 8:05", "x"]) == ["2024-01-05 08:05:00", "x"]
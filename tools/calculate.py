@@ -31,7 +31,7 @@ def  nl_sum(query: str):
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt}
     ]
-    result = get_llm_response_gpt_4o(messages)
+    result = get_llm_response_gpt_4o(messages, temperature=0, use_cache=True)
     
     try:
         result = json.loads(result)
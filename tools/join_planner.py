@@ -0,0 +1,136 @@
+import heapq
+import threading
+from typing import Dict, List, Optional
+from tools.schema_registry import SchemaSnapshot, get_schema_registry
+
+
+class JoinPlanner:
+    """基于 relations.json 关系图的连接路径规划。
+
+    关系视为无向边，边权取关系中的 cost 字段（缺省为1）。构造时对每个节点跑一次Dijkstra，
+    预计算全部节点对之间的最短路径；plan() 用贪心的Steiner树近似把多张表连成一棵连接树，
+    路径上的中间表即为需要补充的桥接表。
+    """
+
+    def __init__(self, snapshot: SchemaSnapshot):
+        self.snapshot = snapshot
+        self.version = snapshot.version
+        relations = snapshot.relations or []
+        self._edges: Dict[str, List[tuple]] = {}
+        for idx, r in enumerate(relations):
+            s, t = str(r.get("source")), str(r.get("target"))
+            if s == t:
+                continue
+            try:
+                cost = float(r.get("cost", 1))
+            except (TypeError, ValueError):
+                cost = 1.0
+            self._edges.setdefault(s, []).append((t, cost, idx))
+            self._edges.setdefault(t, []).append((s, cost, idx))
+
+        # source -> {target: (距离, 前驱节点, 前驱边)}
+        self._paths: Dict[str, Dict[str, tuple]] = {node: self._dijkstra(node) for node in self._edges}
+
+    def _dijkstra(self, source: str) -> Dict[str, tuple]:
+        best = {source: (0.0, None, None)}
+        heap = [(0.0, source)]
+        while heap:
+            dist, node = heapq.heappop(heap)
+            if dist > best[node][0]:
+                continue
+            for nxt, cost, idx in self._edges.get(node, []):
+                nd = dist + cost
+                if nxt not in best or nd < best[nxt][0]:
+                    best[nxt] = (nd, node, idx)
+                    heapq.heappush(heap, (nd, nxt))
+        return best
+
+    def distance(self, a: str, b: str) -> Optional[float]:
+        entry = self._paths.get(a, {}).get(b)
+        return entry[0] if entry else None
+
+    def path(self, a: str, b: str) -> Optional[tuple[List[str], List[int]]]:
+        """返回 a 到 b 的最短路径 (节点列表, 关系下标列表)，不连通时返回None"""
+        tree = self._paths.get(a)
+        if tree is None or b not in tree:
+            return ([a], []) if a == b else None
+        nodes, edges = [b], []
+        node = b
+        while node != a:
+            _, prev, idx = tree[node]
+            nodes.append(prev)
+            edges.append(idx)
+            node = prev
+        return nodes[::-1], edges[::-1]
+
+    def plan(self, table_names: List[str]) -> Dict:
+        """为给定的表规划连接树。
+
+        Returns:
+            {"tables": 连接树上的全部表, "bridging": 自动补充的中间表,
+             "relations": 连接树用到的关系, "unreachable": 无法连通的表}
+        """
+        terminals = []
+        for name in table_names:
+            canon = self.snapshot.canonical_name(name)
+            if canon not in terminals:
+                terminals.append(canon)
+
+        connected = [t for t in terminals if t in self._edges]
+        unreachable = [t for t in terminals if t not in self._edges]
+        tree_nodes: List[str] = connected[:1]
+        tree_edges: List[int] = []
+        remaining = connected[1:]
+        while remaining:
+            # 选出离当前连接树最近的表，把最短路径并入连接树
+            best = None
+            for target in remaining:
+                for node in tree_nodes:
+                    d = self.distance(node, target)
+                    if d is not None and (best is None or d < best[0]):
+                        best = (d, node, target)
+            if best is None:
+                unreachable.extend(remaining)
+                break
+            _, node, target = best
+            nodes, edges = self.path(node, target)
+            for n in nodes:
+                if n not in tree_nodes:
+                    tree_nodes.append(n)
+            for e in edges:
+                if e not in tree_edges:
+                    tree_edges.append(e)
+            remaining.remove(target)
+
+        relations = self.snapshot.relations or []
+        return {
+            "tables": tree_nodes + [t for t in unreachable if t not in tree_nodes],
+            "bridging": [n for n in tree_nodes if n not in terminals],
+            "relations": [
+                {
+                    "source": str(relations[i].get("source")),
+                    "target": str(relations[i].get("target")),
+                    "relation": relations[i].get("relation"),
+                    "join_key": relations[i].get("join_key"),
+                }
+                for i in sorted(tree_edges)
+            ],
+            "unreachable": unreachable,
+        }
+
+
+_planner: Optional[JoinPlanner] = None
+_planner_lock = threading.Lock()
+
+
+def get_join_planner() -> JoinPlanner:
+    """返回与当前schema快照对应的规划器，关系文件变化后自动重建"""
+    global _planner
+    snapshot = get_schema_registry().snapshot()
+    planner = _planner
+    if planner is None or planner.version != snapshot.version:
+        with _planner_lock:
+            if _planner is None or _planner.version != snapshot.version:
+                _planner = JoinPlanner(snapshot)
+            planner = _planner
+    return planner
@@ -1,9 +1,35 @@
 from fastmcp import Client
+from fastmcp.client.messages import MessageHandler
 import asyncio
 import os   
+import time
 from dotenv import load_dotenv, find_dotenv
+from utils.logger import setup_logger
 load_dotenv(find_dotenv())
 
+logger = setup_logger('mcp_client', enable_console=False)
+
+# 工具目录缓存的有效期（秒），服务端发出 tools/list_changed 通知时会提前失效
+MCP_TOOLS_TTL = float(os.getenv("MCP_TOOLS_TTL", "300"))
+# 单个工具的并发上限，格式如 "search_database=3,think=1"；未列出的工具使用默认上限
+MCP_TOOL_CONCURRENCY = os.getenv("MCP_TOOL_CONCURRENCY", "")
+MCP_DEFAULT_TOOL_CONCURRENCY = int(os.getenv("MCP_DEFAULT_TOOL_CONCURRENCY", "8"))
+
+
+def parse_tool_concurrency(spec: str) -> dict[str, int]:
+    """解析 "name=N,name2=M" 形式的并发上限配置"""
+    limits = {}
+    for item in (spec or "").split(","):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if not name or not value.strip():
+            continue
+        try:
+            limits[name] = max(1, int(value))
+        except ValueError:
+            logger.info(f"忽略无效的并发配置: {item}")
+    return limits
+
 async def get_available_tools_async():
     async with Client(os.getenv("MCP_SERVER_URL")) as client:
         tools = await client.list_tools()
@@ -15,6 +41,132 @@ async def call_tool(function_name: str, function_args: dict):
         result = await client.call_tool(function_name, function_args)
         return result.content[0].text
 
+class _ToolListChangedHandler(MessageHandler):
+    """监听服务端的工具列表变更通知，使会话的工具目录缓存失效"""
+
+    def __init__(self, session: "MCPSession"):
+        super().__init__()
+        self._session = session
+
+    async def on_tool_list_changed(self, notification) -> None:
+        logger.info("收到 tools/list_changed 通知，工具目录缓存失效")
+        self._session.invalidate_tools()
+
+
+class MCPSession:
+    """由agent持有的长连接MCP会话。
+
+    - 整个生命周期复用同一个 fastmcp.Client 连接，断开后在下次调用时自动重连。
+    - 缓存工具目录（含转换后的OpenAI tools格式），仅在收到列表变更通知或TTL过期时刷新。
+    - 会话绑定在首次使用它的事件循环上，同步代码请通过 utils.async_runner.run_sync 调用。
+    """
+
+    def __init__(self, server_url: str | None = None, tools_ttl: float | None = None,
+                 tool_concurrency: dict[str, int] | None = None):
+        self.server_url = server_url or os.getenv("MCP_SERVER_URL")
+        self.tools_ttl = MCP_TOOLS_TTL if tools_ttl is None else tools_ttl
+        self.tool_concurrency = (parse_tool_concurrency(MCP_TOOL_CONCURRENCY)
+                                 if tool_concurrency is None else dict(tool_concurrency))
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._client: Client | None = None
+        self._connect_lock: asyncio.Lock | None = None
+        self._tools = None
+        self._openai_tools = None
+        self._tools_expire_at = 0.0
+
+    def invalidate_tools(self):
+        self._tools_expire_at = 0.0
+
+    def _lock(self) -> asyncio.Lock:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        return self._connect_lock
+
+    async def _ensure_client(self) -> Client:
+        client = self._client
+        if client is not None and client.is_connected():
+            return client
+        async with self._lock():
+            if self._client is not None and self._client.is_connected():
+                return self._client
+            await self._drop_client()
+            client = Client(self.server_url, message_handler=_ToolListChangedHandler(self))
+            await client.__aenter__()
+            self._client = client
+            # 新连接上服务端的工具可能已变化
+            self.invalidate_tools()
+            logger.info(f"MCP会话已建立: {self.server_url}")
+            return client
+
+    async def _drop_client(self):
+        client, self._client = self._client, None
+        if client is None:
+            return
+        try:
+            await client.__aexit__(None, None, None)
+        except Exception as e:
+            logger.info(f"关闭MCP连接异常: {e}")
+
+    async def list_tools(self):
+        """返回MCP工具列表，命中缓存时不发起请求"""
+        if self._tools is not None and time.monotonic() < self._tools_expire_at:
+            return self._tools
+        client = await self._ensure_client()
+        try:
+            tools = await client.list_tools()
+        except Exception:
+            # 仅在连接已断开时重连一次，其他错误照常抛出
+            if client.is_connected():
+                raise
+            await self._drop_client()
+            client = await self._ensure_client()
+            tools = await client.list_tools()
+        self._tools = tools
+        self._openai_tools = [convert_mcp_tool_to_openai(tool.__dict__) for tool in tools]
+        self._tools_expire_at = time.monotonic() + self.tools_ttl
+        logger.info(f"刷新工具目录，共 {len(tools)} 个工具")
+        return tools
+
+    async def list_openai_tools(self) -> list[dict]:
+        """返回转换为OpenAI tools格式的工具列表（随工具目录一起缓存）"""
+        await self.list_tools()
+        return self._openai_tools
+
+    def _semaphore(self, function_name: str) -> asyncio.Semaphore:
+        sem = self._semaphores.get(function_name)
+        if sem is None:
+            limit = self.tool_concurrency.get(function_name, MCP_DEFAULT_TOOL_CONCURRENCY)
+            sem = self._semaphores[function_name] = asyncio.Semaphore(limit)
+        return sem
+
+    async def call_tool(self, function_name: str, function_args: dict) -> str:
+        async with self._semaphore(function_name):
+            return await self._call_tool(function_name, function_args)
+
+    async def call_tools(self, calls: list[tuple[str, dict]]) -> list:
+        """并发执行多个工具调用，结果按传入顺序返回；单个调用的异常作为结果返回，不影响其他调用"""
+        return await asyncio.gather(
+            *(self.call_tool(name, args) for name, args in calls),
+            return_exceptions=True,
+        )
+
+    async def _call_tool(self, function_name: str, function_args: dict) -> str:
+        client = await self._ensure_client()
+        try:
+            result = await client.call_tool(function_name, function_args)
+        except Exception:
+            if client.is_connected():
+                raise
+            await self._drop_client()
+            client = await self._ensure_client()
+            result = await client.call_tool(function_name, function_args)
+        return result.content[0].text
+
+    async def close(self):
+        async with self._lock():
+            await self._drop_client()
+
+
 def convert_mcp_tool_to_openai(mcp_tool):
     return {
         "type": "function",
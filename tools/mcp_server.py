@@ -52,7 +52,8 @@ def think_tool(reason: Annotated[str, Field(description="思考和推理的原
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": prompt.format(whiteboard_info=whiteboard_info_str, reason=reason)}
     ]
-    result = get_llm_response_gpt_4o(messages) 
+    # whiteboard与思考理由未变化时直接复用上一次的思考结果
+    result = get_llm_response_gpt_4o(messages, use_cache=True)
     logger.info(f"LLM思考结果: {result}")
     logger.info(f"LLM思考推理完成，结果长度: {len(result)}")
     
@@ -78,7 +79,8 @@ def search_database_tool(tables: Annotated[list[str], Field(description="要查
         table_name (str): 要查询的数据库表名
         
     Returns:
-        str: 数据库查询结果的JSON字符串
+        str: 数据库查询结果的JSON字符串，列式编码：columns 为列名，rows 为对应顺序的行数组。
+        结果较多时只返回预览行，has_more 为 true 并附带 handle，可用 fetch_result_page 工具继续翻页。
     """
     from tools.search_database import search_database
 
@@ -87,6 +89,19 @@ def search_database_tool(tables: Annotated[list[str], Field(description="要查
     # 工具返回类型声明为字符串，这里将结果转为JSON字符串以通过输出校验
     return json.dumps(result, ensure_ascii=False)
 
+@mcp.tool(name="fetch_result_page")
+def fetch_result_page_tool(handle: Annotated[str, Field(description="search_database 返回的结果句柄 handle")],
+                           page_size: Annotated[Optional[int], Field(description="本页行数，缺省为系统默认值")] = None) -> str:
+    """
+    读取 search_database 结果的下一页。仅当上一次结果的 has_more 为 true 时调用，返回格式与 search_database 相同（columns + rows），
+    读完后不再返回 handle。句柄会在一段时间不用后过期，过期后需要重新查询。请只在确实需要更多行时翻页，能通过更精确的查询条件缩小结果时优先改写查询。
+    """
+    from tools.search_database import fetch_result_page
+
+    result = fetch_result_page(handle, page_size)
+    logger.info(f"结果翻页: handle={handle}, rows={len(result.get('rows', []))}, has_more={result.get('has_more')}")
+    return json.dumps(result, ensure_ascii=False)
+
 @mcp.tool(name="todo_write")
 def todo_write_tool(action: Annotated[Literal["todo_create", "todo_complete", "todo_failure", "todo_show"], Field(description="要执行的操作类型：\n"
                     "- todo_create: 创建一个新的 todo DAG\n"
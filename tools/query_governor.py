@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+from dotenv import load_dotenv, find_dotenv
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('query_governor', enable_console=False)
+
+# 单次执行（预览或一次翻页）的时间上限，单位秒
+QUERY_TIMEOUT = float(os.getenv("QUERY_TIMEOUT", "15"))
+# 单次执行的SQLite虚拟机指令预算
+QUERY_MAX_VM_STEPS = int(os.getenv("QUERY_MAX_VM_STEPS", "500000000"))
+# 进度回调的触发间隔（虚拟机指令数）
+QUERY_PROGRESS_INTERVAL = int(os.getenv("QUERY_PROGRESS_INTERVAL", "10000"))
+# 同一层循环中多个全表扫描的行数乘积超过该值时判定为笛卡尔积并拒绝执行
+QUERY_MAX_CROSS_ROWS = int(os.getenv("QUERY_MAX_CROSS_ROWS", "10000000"))
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 查询日志同时被 data/index_provisioner.py 读取；相对路径以项目根目录为基准，与运行时的工作目录无关
+QUERY_LOG_PATH = os.path.join(PROJECT_ROOT, os.getenv("QUERY_LOG_PATH", os.path.join(os.getenv("LOG_DIR", "logs"), "search_database_queries.jsonl")))
+
+_IDENT = r'(?:"[^"]+"|[^\s,()."]+)'
+# FROM/JOIN 子句中的 [库.]表 [AS] 别名
+_TABLE_REF = re.compile(
+    rf'(?:\bFROM\b|\bJOIN\b|,)\s*({_IDENT}(?:\s*\.\s*{_IDENT})?)'
+    rf'(?:\s+(?:AS\s+)?(?!(?:ON|WHERE|JOIN|LEFT|RIGHT|FULL|INNER|OUTER|CROSS|NATURAL|USING|GROUP|ORDER|LIMIT|UNION|'
+    rf'EXCEPT|INTERSECT|HAVING|WINDOW|FROM|SELECT)\b)({_IDENT}))?',
+    re.IGNORECASE
+)
+# 兼容新旧两种 EXPLAIN QUERY PLAN 输出：SCAN c / SCAN TABLE sales_contract AS c
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(\S+)(?: AS (\S+))?')
+
+
+class QueryRejected(Exception):
+    """EXPLAIN 预检未通过"""
+
+    def __init__(self, message: str, plan: List[str], scans: List[Dict], cost: int):
+        super().__init__(message)
+        self.plan = plan
+        self.scans = scans
+        self.cost = cost
+
+
+def _unquote(name: str) -> str:
+    return name.strip().strip('"')
+
+
+def _table_aliases(sql: str) -> Dict[str, str]:
+    """从SQL的 FROM/JOIN 子句中粗略提取 别名 -> [库.]表名 的映射"""
+    aliases = {}
+    for m in _TABLE_REF.finditer(sql):
+        table = ".".join(_unquote(part) for part in m.group(1).split("."))
+        aliases[_unquote(table.split(".")[-1])] = table
+        aliases[table] = table
+        if m.group(2):
+            aliases[_unquote(m.group(2))] = table
+    return aliases
+
+
+def _estimate_rows(conn: sqlite3.Connection, table: str) -> Optional[int]:
+    """用 max(rowid) 估算表行数（只读B树末端，不做全表扫描），无法估算时返回None"""
+    qualified = ".".join(f'"{part}"' for part in table.split("."))
+    try:
+        row = conn.execute(f"SELECT max(rowid) FROM {qualified}").fetchone()
+    except sqlite3.Error:
+        return None
+    return int(row[0] or 0)
+
+
+def check_plan(conn: sqlite3.Connection, sql: str, params=()) -> Dict:
+    """执行前用 EXPLAIN QUERY PLAN 检查计划，拒绝大表之间的笛卡尔积。
+
+    Returns:
+        {"plan": 计划明细, "scans": [{table, rows}], "cost": 估算的嵌套扫描行数}
+    Raises:
+        QueryRejected: 同一层循环中多个全表扫描的行数乘积超过 QUERY_MAX_CROSS_ROWS
+    """
+    rows = conn.execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    plan = [r[3] for r in rows]
+    aliases = None
+    scans: List[Dict] = []
+    # 按父节点分组：同一父节点下的多个扫描是嵌套循环关系
+    groups: Dict[int, List[int]] = {}
+    for node_id, parent, _, detail in rows:
+        m = _SCAN.match(detail)
+        if m is None or detail.startswith("SCAN CONSTANT ROW") or m.group(1).startswith("("):
+            continue
+        if aliases is None:
+            aliases = _table_aliases(sql)
+        name = m.group(2) or m.group(1)
+        table = aliases.get(name, m.group(1))
+        est = _estimate_rows(conn, table)
+        scans.append({"table": table, "rows": est})
+        if est is not None:
+            groups.setdefault(parent, []).append(est)
+
+    cost = 0
+    for group in groups.values():
+        product = 1
+        for est in group:
+            product *= max(est, 1)
+        cost = max(cost, product)
+        if len(group) > 1 and product > QUERY_MAX_CROSS_ROWS:
+            raise QueryRejected(
+                f"查询计划包含大表之间的全表笛卡尔积（估算 {product} 行组合，上限 {QUERY_MAX_CROSS_ROWS}）",
+                plan, scans, product)
+    return {"plan": plan, "scans": scans, "cost": cost}
+
+
+class QueryBudget:
+    """通过SQLite进度回调限制单次执行的时长与虚拟机指令数。
+
+    每次执行（首次查询或翻页）前调用 arm() 重新计时；超出限制时SQLite中断当前语句，
+    抛出 sqlite3.OperationalError('interrupted')，reason 记录中断原因。
+    """
+
+    def __init__(self, timeout: float = QUERY_TIMEOUT, max_steps: int = QUERY_MAX_VM_STEPS,
+                 interval: int = QUERY_PROGRESS_INTERVAL):
+        self.timeout = timeout
+        self.max_steps = max_steps
+        self.interval = interval
+        self.steps = 0
+        self.started = time.monotonic()
+        self.reason: Optional[str] = None
+
+    def arm(self):
+        self.steps = 0
+        self.started = time.monotonic()
+        self.reason = None
+
+    def _handler(self) -> int:
+        self.steps += self.interval
+        if time.monotonic() - self.started > self.timeout:
+            self.reason = "timeout"
+            return 1
+        if self.steps > self.max_steps:
+            self.reason = "step_budget"
+            return 1
+        return 0
+
+    def install(self, conn: sqlite3.Connection):
+        self.arm()
+        conn.set_progress_handler(self._handler, self.interval)
+
+    @staticmethod
+    def uninstall(conn: sqlite3.Connection):
+        conn.set_progress_handler(None, 0)
+
+    @property
+    def elapsed_ms(self) -> int:
+        return int((time.monotonic() - self.started) * 1000)
+
+    def error(self, sql: str) -> Dict:
+        """被中断时返回给agent的结构化错误"""
+        if self.reason == "timeout":
+            message = f"查询超时（超过 {self.timeout:g} 秒）已被终止"
+        else:
+            message = f"查询计算量超出预算（{self.max_steps} 步）已被终止"
+        return {
+            "error": message,
+            "error_type": self.reason,
+            "elapsed_ms": self.elapsed_ms,
+            "vm_steps": self.steps,
+            "sql": sql,
+            "hint": "请增加过滤条件、确认连接键正确，或把问题拆成多个更小的查询。",
+        }
+
+
+_log_lock = threading.Lock()
+
+
+def log_query(record: Dict):
+    """把一次查询的计划与开销追加到JSONL查询日志"""
+    record = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), **record}
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(QUERY_LOG_PATH) or ".", exist_ok=True)
+            with open(QUERY_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"写入查询日志失败: {e}")
@@ -0,0 +1,158 @@
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from dotenv import load_dotenv, find_dotenv
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('result_store', enable_console=False)
+
+# 首次返回给LLM的预览行数
+SEARCH_PREVIEW_ROWS = int(os.getenv("SEARCH_PREVIEW_ROWS", "50"))
+# 单个查询最多可读取的总行数（预览+翻页）
+SEARCH_MAX_ROWS = int(os.getenv("SEARCH_MAX_ROWS", "5000"))
+# 翻页时单页的默认/最大行数
+SEARCH_PAGE_SIZE = int(os.getenv("SEARCH_PAGE_SIZE", "100"))
+RESULT_HANDLE_TTL = float(os.getenv("RESULT_HANDLE_TTL", "300"))
+RESULT_MAX_HANDLES = int(os.getenv("RESULT_MAX_HANDLES", "32"))
+
+
+class ResultHandle:
+    """持有未读完游标的服务端结果句柄，独占一个只读连接，关闭时一并释放"""
+
+    def __init__(self, conn: sqlite3.Connection, cursor: sqlite3.Cursor, columns: List[str],
+                 sql: str, pending: List[tuple], offset: int, budget=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.conn = conn
+        self.cursor = cursor
+        self.columns = columns
+        self.sql = sql
+        # 预览时为判断是否还有数据而多读出的行
+        self._pending = pending
+        self.offset = offset
+        self.accessed_at = time.time()
+        self.closed = False
+        # 已安装在连接上的 QueryBudget，每次读取前重新计时
+        self.budget = budget
+        self._lock = threading.Lock()
+
+    def fetch(self, page_size: int) -> Dict:
+        with self._lock:
+            if self.closed:
+                raise KeyError(self.id)
+            self.accessed_at = time.time()
+            if self.budget is not None:
+                self.budget.arm()
+            limit = max(0, min(page_size, SEARCH_MAX_ROWS - self.offset))
+            rows = self._pending[:limit]
+            self._pending = self._pending[limit:]
+            if len(rows) < limit:
+                rows.extend(self.cursor.fetchmany(limit - len(rows)))
+            start = self.offset
+            self.offset += len(rows)
+
+            has_more = bool(self._pending)
+            if not has_more and len(rows) == limit:
+                peek = self.cursor.fetchone()
+                if peek is not None:
+                    self._pending = [peek]
+                    has_more = True
+            truncated = has_more and self.offset >= SEARCH_MAX_ROWS
+            return {
+                "columns": self.columns,
+                "rows": [list(r) for r in rows],
+                "offset": start,
+                "has_more": has_more and not truncated,
+                "truncated": truncated,
+            }
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.closed = True
+            try:
+                self.cursor.close()
+                self.conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"关闭结果句柄 {self.id} 失败: {e}")
+
+
+class ResultStore:
+    """结果句柄表：按TTL过期，超过最大句柄数时关闭最久未访问的句柄"""
+
+    def __init__(self, ttl: float = RESULT_HANDLE_TTL, max_handles: int = RESULT_MAX_HANDLES):
+        self.ttl = ttl
+        self.max_handles = max_handles
+        self._handles: "OrderedDict[str, ResultHandle]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        now = time.time()
+        victims = [h for h in self._handles.values() if now - h.accessed_at > self.ttl]
+        while len(self._handles) - len(victims) > self.max_handles:
+            oldest = next(h for h in self._handles.values() if h not in victims)
+            victims.append(oldest)
+        for handle in victims:
+            self._handles.pop(handle.id, None)
+        return victims
+
+    def register(self, handle: ResultHandle) -> str:
+        with self._lock:
+            self._handles[handle.id] = handle
+            victims = self._expire()
+        for h in victims:
+            logger.info(f"结果句柄过期或超出上限，关闭: {h.id}")
+            h.close()
+        return handle.id
+
+    def fetch(self, handle_id: str, page_size: int = SEARCH_PAGE_SIZE) -> Dict:
+        with self._lock:
+            victims = self._expire()
+            handle = self._handles.get(handle_id)
+            if handle is not None:
+                self._handles.move_to_end(handle_id)
+        for h in victims:
+            h.close()
+        if handle is None:
+            return {"error": f"结果句柄不存在或已过期: {handle_id}，请重新查询。"}
+
+        page_size = max(1, min(int(page_size), SEARCH_PAGE_SIZE))
+        try:
+            page = handle.fetch(page_size)
+        except KeyError:
+            return {"error": f"结果句柄不存在或已过期: {handle_id}，请重新查询。"}
+        except sqlite3.Error as e:
+            self.close(handle_id)
+            if handle.budget is not None and handle.budget.reason:
+                return handle.budget.error(handle.sql)
+            return {"error": str(e)}
+
+        if page["has_more"]:
+            page["handle"] = handle_id
+        else:
+            # 已读完或达到行数上限，立即释放连接
+            self.close(handle_id)
+        return page
+
+    def close(self, handle_id: str):
+        with self._lock:
+            handle = self._handles.pop(handle_id, None)
+        if handle is not None:
+            handle.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._handles)
+
+
+_result_store = ResultStore()
+
+
+def get_result_store() -> ResultStore:
+    return _result_store
@@ -0,0 +1,179 @@
+import os
+import json
+import threading
+from typing import Dict, List, Optional
+from dotenv import load_dotenv, find_dotenv
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('schema_registry', enable_console=False)
+
+SCHEMA_TABLES_JSON = os.getenv("SCHEMA_TABLES_JSON", "/home/wangling/projects/agents_herd/data_2/tables.json")
+SCHEMA_RELATIONS_JSON = os.getenv("SCHEMA_RELATIONS_JSON", "/home/wangling/projects/agents_herd/data_2/relations.json")
+
+# 模糊匹配索引的最大n-gram长度
+_MAX_GRAM = 3
+
+
+def _ngrams(text: str, n: int) -> set:
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+class SchemaSnapshot:
+    """tables.json / relations.json 某一时刻的只读索引视图"""
+
+    def __init__(self, tables: List[Dict], relations: Optional[List[Dict]], version: int):
+        self.version = version
+        self.tables = tables
+        self.by_name: Dict[str, Dict] = {}
+        self.by_code: Dict[str, Dict] = {}
+        # n-gram -> 表在 tables 中的下标集合，用于子串匹配的候选过滤
+        self._gram_index: Dict[str, set] = {}
+
+        for idx, item in enumerate(tables):
+            name = str(item.get("table_name", ""))
+            code = str(item.get("table", ""))
+            # 与线性扫描保持一致：重复名称以第一次出现为准
+            if item.get("table_name") is not None:
+                self.by_name.setdefault(name, item)
+            if item.get("table") is not None:
+                self.by_code.setdefault(code, item)
+            for text in (name, code):
+                for n in range(1, _MAX_GRAM + 1):
+                    for gram in _ngrams(text, n):
+                        self._gram_index.setdefault(gram, set()).add(idx)
+
+        # relations.json 不存在时为 None
+        self.relations = relations
+        self.adjacency: Dict[str, List[int]] = {}
+        for idx, r in enumerate(relations or []):
+            s = str(r.get("source"))
+            t = str(r.get("target"))
+            self.adjacency.setdefault(s, []).append(idx)
+            if t != s:
+                self.adjacency.setdefault(t, []).append(idx)
+
+    def find_table(self, table_name: str) -> Optional[Dict]:
+        """优先精确匹配 table_name 或表代码 table；找不到则进行包含匹配（按配置顺序取第一个）"""
+        target = self.by_name.get(table_name) or self.by_code.get(table_name)
+        if target is not None or not table_name:
+            return target
+
+        n = min(_MAX_GRAM, len(table_name))
+        candidates = None
+        for gram in _ngrams(table_name, n):
+            postings = self._gram_index.get(gram)
+            if not postings:
+                return None
+            candidates = set(postings) if candidates is None else candidates & postings
+            if not candidates:
+                return None
+        for idx in sorted(candidates or ()):
+            item = self.tables[idx]
+            if table_name in str(item.get("table_name", "")) or table_name in str(item.get("table", "")):
+                return item
+        return None
+
+    def canonical_name(self, name: str) -> str:
+        """将表代码或（模糊的）中文表名规范化为 relations.json 使用的中文表名，与 find_table 的匹配规则一致"""
+        if name in self.by_name:
+            return name
+        item = self.find_table(name)
+        if item is not None and item.get("table_name"):
+            return str(item.get("table_name"))
+        return name
+
+    def relations_between(self, names: List[str]) -> List[Dict]:
+        """返回给定表两两之间的无方向关系，顺序与 relations.json 一致"""
+        canon = {self.canonical_name(n) for n in names}
+        if len(canon) < 2:
+            return []
+        hits = set()
+        for name in canon:
+            for idx in self.adjacency.get(name, []):
+                r = self.relations[idx]
+                s, t = str(r.get("source")), str(r.get("target"))
+                if s != t and s in canon and t in canon:
+                    hits.add(idx)
+        result = []
+        for idx in sorted(hits):
+            r = self.relations[idx]
+            result.append({
+                "source": str(r.get("source")),
+                "target": str(r.get("target")),
+                "relation": r.get("relation"),
+                "join_key": r.get("join_key"),
+            })
+        return result
+
+
+class SchemaRegistry:
+    """进程内的schema注册表：只加载一次，文件mtime变化时整体重建并原子替换快照"""
+
+    def __init__(self, tables_path: str = SCHEMA_TABLES_JSON, relations_path: str = SCHEMA_RELATIONS_JSON):
+        self.tables_path = tables_path
+        self.relations_path = relations_path
+        self._snapshot: Optional[SchemaSnapshot] = None
+        self._mtimes = None
+        self._version = 0
+        self._lock = threading.Lock()
+
+    def _stat(self):
+        def mtime(path):
+            try:
+                return os.stat(path).st_mtime_ns
+            except OSError:
+                return None
+        return mtime(self.tables_path), mtime(self.relations_path)
+
+    def snapshot(self) -> SchemaSnapshot:
+        mtimes = self._stat()
+        if self._snapshot is not None and mtimes == self._mtimes:
+            return self._snapshot
+        with self._lock:
+            if self._snapshot is None or mtimes != self._mtimes:
+                self._snapshot = self._load(mtimes)
+                self._mtimes = mtimes
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def _load(self, mtimes) -> SchemaSnapshot:
+        tables = []
+        if mtimes[0] is not None:
+            try:
+                with open(self.tables_path, encoding="utf-8") as f:
+                    tables = json.load(f).get("tables", [])
+            except Exception as e:
+                logger.error(f"加载 {self.tables_path} 失败: {e}")
+        if not isinstance(tables, list):
+            tables = []
+
+        relations = None
+        if mtimes[1] is not None:
+            try:
+                with open(self.relations_path, encoding="utf-8") as f:
+                    relations = json.load(f).get("relation", [])
+            except Exception as e:
+                logger.error(f"加载 {self.relations_path} 失败: {e}")
+                relations = []
+
+        self._version += 1
+        logger.info(f"加载schema注册表 v{self._version}: {len(tables)} 张表, {len(relations or [])} 条关系")
+        return SchemaSnapshot(tables, relations, self._version)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_schema_registry() -> SchemaRegistry:
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SchemaRegistry()
+    return _registry
@@ -1,12 +1,18 @@
-
-
 from typing import List, Dict
 import sqlite3
 import os
 import json
-from pathlib import Path
 from models.llm import get_llm_response_gpt_4o
+from tools.schema_registry import get_schema_registry
+from tools.join_planner import get_join_planner
+from tools.sql_plan_cache import get_plan_cache, render_sql
+from tools.sqlite_pool import get_pool, get_table_columns, attach_aliases, SEARCH_MAX_ATTACH
+from tools.query_governor import QueryBudget, QueryRejected, check_plan, log_query
+from tools.result_store import ResultHandle, get_result_store, SEARCH_PREVIEW_ROWS
 from utils.trival_process import clean_sql_response, quote_sql_identifiers
+from utils.logger import setup_logger
+
+logger = setup_logger('search_database', enable_console=False)
 
 
 def get_table_schema(conn, table_name: str):
@@ -18,58 +24,41 @@ def get_table_schema(conn, table_name: str):
 
 def get_table_and_db_path_and_schema(table_name: str) -> Dict:
     """根据中文表名或表代码获取数据库路径和字段schema描述"""
-    config_path = Path("/home/wangling/projects/agents_herd/data_2/tables.json")
-    if not config_path.exists():
-        return None
-
-    # 加载配置
-    with config_path.open(encoding="utf-8") as f:
-        cfg = json.load(f)
-
-    tables_list = cfg.get("tables", [])
-    if not isinstance(tables_list, list) or not tables_list:
+    snapshot = get_schema_registry().snapshot()
+    if not snapshot.tables:
         return None
 
     # 优先精确匹配 table_name 或表代码 table；找不到则进行包含匹配
-    target = None
-    for item in tables_list:
-        if item.get("table_name") == table_name or item.get("table") == table_name:
-            target = item
-            break
-    if target is None:
-        for item in tables_list:
-            name = str(item.get("table_name", ""))
-            code = str(item.get("table", ""))
-            if table_name and (table_name in name or table_name in code):
-                target = item
-                break
-
+    target = snapshot.find_table(table_name)
     if target is None:
         return None
 
     db_path = target.get("table_path")
     
 
-    # 连接数据库并提取 schema；如果库或表不存在，回退到 JSON 中的字段定义
+    # 从连接池读取（已缓存的）表结构；如果库或表不存在，回退到 JSON 中的字段定义
     fields: List[str] = []
     try:
-        conn = sqlite3.connect(db_path)
-        fields = get_table_schema(conn, table_name) or []
-        conn.close()
+        fields = get_table_columns(db_path, table_name) or []
     except Exception:
         fields = []
 
     if not fields:
         fields = [f.get("name") for f in target.get("fields", []) if isinstance(f, dict) and f.get("name")]
 
+    # 导入时按取值推断的列类型（若有）一并提供给LLM，便于生成正确的数值/日期比较
+    field_types = {f.get("name"): f.get("type") for f in target.get("fields", []) if isinstance(f, dict) and f.get("type")}
+    fields_text = ', '.join(f"{f}({field_types[f]})" if f in field_types else f for f in fields)
+
     # schema_text = f"表 {target.get('table_name', table_name)}({table_code}) 的字段: {', '.join(fields)}"
     schema_text = """
     表名称：{table_name}
     表描述：{table_desc}
     字段：{fields}
-    """.format(table_name=target.get('table_name', table_name), table_desc=target.get('table_desc', ''), fields=', '.join(fields))
+    """.format(table_name=target.get('table_name', table_name), table_desc=target.get('table_desc', ''), fields=fields_text)
 
-    return { "db_path": db_path, "table_name": table_name, "schema": schema_text, "fields": fields}
+    return { "db_path": db_path, "table_name": table_name, "table_code": target.get("table") or table_name,
+             "schema": schema_text, "fields": fields}
 
 def get_table_relations(table_names: List[str]) -> Dict:
     """根据输入的表名列表，返回这些表之间的关系。
@@ -85,85 +74,62 @@ def get_table_relations(table_names: List[str]) -> Dict:
     if not table_names:
         return {"relations": []}
 
-    relations_path = Path("/home/wangling/projects/agents_herd/data_2/relations.json")
-    tables_cfg_path = Path("/home/wangling/projects/agents_herd/data_2/tables.json")
-    if not relations_path.exists():
+    snapshot = get_schema_registry().snapshot()
+    if snapshot.relations is None:
         return None
 
-    # 构建代码->中文名映射，便于将输入转换成 relations.json 使用的中文表名
-    code_to_name: Dict[str, str] = {}
-    name_to_name: Dict[str, str] = {}
-    if tables_cfg_path.exists():
-        try:
-            cfg = json.load(tables_cfg_path.open(encoding="utf-8"))
-            for item in cfg.get("tables", []):
-                tn = item.get("table_name")
-                code = item.get("table")
-                if tn:
-                    name_to_name[str(tn)] = str(tn)
-                if code and tn:
-                    code_to_name[str(code)] = str(tn)
-        except Exception:
-            # 如果解析失败，直接使用原始输入名
-            pass
-
-    def canon(n: str) -> str:
-        return code_to_name.get(n, name_to_name.get(n, n))
-
-    canon_names = [canon(n) for n in table_names]
-
-    # 生成两两组合键，用于无方向匹配
-    pair_keys = set()
-    for i in range(len(canon_names)):
-        for j in range(i + 1, len(canon_names)):
-            pair_keys.add(frozenset({canon_names[i], canon_names[j]}))
-
-    # 加载并过滤 relations
-    rels_all = json.load(relations_path.open(encoding="utf-8")).get("relation", [])
-    result = []
-    for r in rels_all:
-        s = str(r.get("source"))
-        t = str(r.get("target"))
-        if frozenset({s, t}) in pair_keys:
-            result.append({
-                "source": s,
-                "target": t,
-                "relation": r.get("relation"),
-                "join_key": r.get("join_key"),
-            })
-
-    return {"relations": result}
+    return {"relations": snapshot.relations_between(table_names)}
 
-def search_database(tables: List[str], query: str):
-    # 基础入参校验，避免空列表或空查询导致运行时异常
-    if not isinstance(tables, list) or len(tables) == 0:
-        return {"error": "未提供查询表名，请至少提供一个表名。"}
-    if not isinstance(query, str) or not query.strip():
-        return {"error": "未提供有效的查询语句，请提供清晰、具体的查询描述。"}
+def _bridging_tables(tables: List[str], db_paths: List[str]) -> List[Dict]:
+    """规划多跳连接路径，返回连接所需的中间表信息。
 
-    # Step 1: 获取每个表的数据库信息
-    table_info = [get_table_and_db_path_and_schema(t) for t in tables]
-    if None in table_info:
-        missing = [t for t, info in zip(tables, table_info) if info is None]
-        return {"error": f"表未注册: {missing}"}
-
-    # Step 2: 检查是否为同一个数据库
-    db_paths = set(info["db_path"] for info in table_info)
-    if len(db_paths) > 1:
-        return {"error": f"不能跨数据库查询: {list(db_paths)}。跨系统的数据建议根据其关联关系分步查询。"}
-
-    schema_text = "\n\n".join([info["schema"] for info in table_info])
+    中间表所在的库会追加到 db_paths 中，附加库数量不超过 SEARCH_MAX_ATTACH。
+    """
+    bridging_info = []
+    if len(tables) < 2:
+        return bridging_info
+    plan = get_join_planner().plan(tables)
+    for name in plan["bridging"]:
+        info = get_table_and_db_path_and_schema(name)
+        if info is None or not info["db_path"]:
+            continue
+        if info["db_path"] not in db_paths:
+            if len(db_paths) - 1 >= SEARCH_MAX_ATTACH:
+                continue
+            db_paths.append(info["db_path"])
+        bridging_info.append(info)
+    return bridging_info
+
+def _generate_sql(tables: List[str], query: str, table_info: List[Dict], bridging_info: List[Dict],
+                  aliases: Dict[str, str]):
+    """调用LLM为查询生成SQL，无法获取表关系时返回None"""
+    federated = len(aliases) > 1
+
+    def _schema(info):
+        if not federated:
+            return info["schema"]
+        # 跨库查询时标明表所在的库别名
+        return info["schema"].rstrip() + f'\n    SQL中引用为：{aliases[info["db_path"]]}."{info["table_code"]}"\n'
+
+    schema_text = "\n\n".join([_schema(info) for info in table_info])
+    if bridging_info:
+        schema_text += "\n\n以下为自动补充的中间关联表，用于连接上述表:\n" + "\n\n".join(
+            [_schema(info) for info in bridging_info])
     # 聚合所有字段用于后续标识符引号处理
     all_fields = []
-    for info in table_info:
+    for info in table_info + bridging_info:
         fs = info.get("fields", [])
         if isinstance(fs, list):
             all_fields.extend(fs)
 
-    table_relations = get_table_relations(tables)
+    table_relations = get_table_relations(tables + [info["table_name"] for info in bridging_info])
     if table_relations is None:
-        return {"error": "无法获取表关系"}
+        return None
     
+    federated_note = ""
+    if federated:
+        federated_note = "- 这些表分布在多个数据库中，已挂载到同一个连接上。引用表时必须带上库别名前缀（见各表的“SQL中引用为”），可以直接跨库连接。\n"
+
     system_prompt = f"""你是一个SQL专家，根据数据表之间的schema、表关系和用户的查询描述，生成符合要求的SQL查询。
     数据库结构如下:\n{schema_text}
     表关系如下:\n{table_relations}
@@ -171,44 +137,138 @@ def search_database(tables: List[str], query: str):
     注意：
     - db中的表是以表代码为名称的，而不是中文表名。表代码与表名称不一定一致，以表代码为查询条件。
     - 如果字段名包含中文、空格或括号等特殊字符，请使用双引号包裹列名和表名，例如 "实际交货数量(库存单位)"。
-
+    {federated_note}
     要求:
     - 不能生成除了SQL查询以外的任何内容。
     """
 
-    print(system_prompt)
+    logger.debug(f"SQL生成提示词: {system_prompt}")
 
     messages = [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": f"根据以下查询描述生成SQL查询: {query}"}
     ]
-    response = get_llm_response_gpt_4o(messages)
+    # SQL生成是确定性步骤，使用 temperature=0；不走LLM响应缓存，避免执行失败的SQL被反复复用
+    # （执行成功的SQL由计划缓存复用）
+    response = get_llm_response_gpt_4o(messages, temperature=0)
     sql = response.strip()
     
     sql = clean_sql_response(sql)
     # 为包含括号、中文或特殊字符的列名加双引号，避免SQLite解析错误
     sql = quote_sql_identifiers(sql, all_fields)
-    print(sql)
+    logger.debug(f"生成的SQL: {sql}")
+    return sql
+
+def search_database(tables: List[str], query: str):
+    # 基础入参校验，避免空列表或空查询导致运行时异常
+    if not isinstance(tables, list) or len(tables) == 0:
+        return {"error": "未提供查询表名，请至少提供一个表名。"}
+    if not isinstance(query, str) or not query.strip():
+        return {"error": "未提供有效的查询语句，请提供清晰、具体的查询描述。"}
+
+    # Step 1: 获取每个表的数据库信息
+    table_info = [get_table_and_db_path_and_schema(t) for t in tables]
+    if None in table_info:
+        missing = [t for t, info in zip(tables, table_info) if info is None]
+        return {"error": f"表未注册: {missing}"}
+
+    # Step 2: 涉及多个数据库时ATTACH到同一个连接上联合查询，附加库数量受限
+    unconfigured = [t for t, info in zip(tables, table_info) if not info["db_path"]]
+    if unconfigured:
+        return {"error": f"表未配置数据库路径: {unconfigured}"}
+    db_paths = list(dict.fromkeys(info["db_path"] for info in table_info))
+    if len(db_paths) - 1 > SEARCH_MAX_ATTACH:
+        return {"error": f"跨库查询涉及 {len(db_paths)} 个数据库，超过上限 {SEARCH_MAX_ATTACH + 1}: {db_paths}。请减少表数量或分步查询。"}
+    bridging_info = _bridging_tables(tables, db_paths)
+    # 库别名与表的输入顺序无关，保证缓存的SQL在不同调用间可复用
+    aliases = attach_aliases(sorted(db_paths))
+
+    # Step 3: 相同表集合、相同形状的查询直接复用已验证的参数化SQL，否则调用LLM生成
+    plan_cache = get_plan_cache()
+    cached_plan = plan_cache.lookup(tables, query)
+    params = []
+    if cached_plan is not None:
+        sql, params = cached_plan
+        logger.info(f"命中SQL计划缓存: {sql} {params}")
+    else:
+        sql = _generate_sql(tables, query, table_info, bridging_info, aliases)
+        if sql is None:
+            return {"error": "无法获取表关系"}
+
     # Step 4: 执行 SQL
-    # 更稳健地获取唯一的数据库路径（避免空列表越界）
-    try:
-        db_path = next(iter(db_paths))
-    except StopIteration:
+    db_path = next((path for path, alias in aliases.items() if alias == "main"), None)
+    if not db_path:
         return {"error": "无法确定数据库路径，请检查表配置。"}
+    attached = {alias: path for path, alias in aliases.items() if alias != "main"}
+    rendered_sql = render_sql(sql, params) if params else sql
+    pool = get_pool(db_path, attached)
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        rows = cursor.fetchall()
-        cols = [desc[0] for desc in cursor.description]
-        conn.close()
+        conn = pool.acquire()
     except Exception as e:
-        return {"error": str(e), "sql": sql}
-
-    return {
-        "sql": sql,
-        "result": [dict(zip(cols, r)) for r in rows]
+        return {"error": str(e), "sql": rendered_sql}
+    log_record = {"tables": tables, "databases": {alias: path for path, alias in aliases.items()},
+                  "sql": rendered_sql, "cached_plan": cached_plan is not None}
+    budget = QueryBudget()
+    try:
+        # 执行前检查查询计划，拒绝大表之间的笛卡尔积
+        plan_info = check_plan(conn, sql, params)
+        log_record.update(plan_info)
+        budget.install(conn)
+        cursor = conn.execute(sql, params)
+        cols = [desc[0] for desc in cursor.description] if cursor.description else []
+        # 只流式读取预览行，剩余结果留在服务端游标上按需翻页
+        handle = ResultHandle(conn, cursor, cols, rendered_sql, [], 0, budget=budget)
+        page = handle.fetch(SEARCH_PREVIEW_ROWS)
+    except QueryRejected as e:
+        pool.release(conn)
+        log_query({**log_record, "status": "rejected", "plan": e.plan, "scans": e.scans, "cost": e.cost})
+        return {"error": str(e), "error_type": "cartesian_join", "sql": rendered_sql, "plan": e.plan,
+                "hint": "请检查表之间的连接条件是否完整，或增加过滤条件后重新查询。"}
+    except sqlite3.DatabaseError as e:
+        QueryBudget.uninstall(conn)
+        pool.release(conn)
+        if budget.reason:
+            error = budget.error(rendered_sql)
+            log_query({**log_record, "status": budget.reason, "elapsed_ms": error["elapsed_ms"], "vm_steps": budget.steps})
+            return error
+        log_query({**log_record, "status": "error", "error": str(e)})
+        return {"error": str(e), "sql": rendered_sql}
+    except Exception as e:
+        pool.discard(conn)
+        log_query({**log_record, "status": "error", "error": str(e)})
+        return {"error": str(e), "sql": rendered_sql}
+
+    log_query({**log_record, "status": "ok", "elapsed_ms": budget.elapsed_ms, "vm_steps": budget.steps,
+               "rows": len(page["rows"]), "has_more": page["has_more"]})
+
+    # 只缓存执行成功的SQL
+    if cached_plan is None:
+        plan_cache.store(tables, query, sql)
+
+    result = {
+        "sql": rendered_sql,
+        "columns": page["columns"],
+        "rows": page["rows"],
+        "row_count": len(page["rows"]),
+        "has_more": page["has_more"],
+        "truncated": page["truncated"],
     }
+    if page["has_more"]:
+        # 连接交给结果句柄持有，直到读完、过期或被淘汰
+        pool.detach(conn)
+        result["handle"] = get_result_store().register(handle)
+    else:
+        cursor.close()
+        QueryBudget.uninstall(conn)
+        pool.release(conn)
+    return result
+
+def fetch_result_page(handle: str, page_size: int = None) -> Dict:
+    """按句柄读取 search_database 剩余结果的下一页"""
+    store = get_result_store()
+    if page_size is None:
+        return store.fetch(handle)
+    return store.fetch(handle, page_size)
 
 if __name__ == "__main__":
     
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv, find_dotenv
+from tools.schema_registry import get_schema_registry
+from utils.logger import setup_logger
+
+load_dotenv(find_dotenv())
+
+logger = setup_logger('sql_plan_cache', enable_console=False)
+
+SQL_PLAN_CACHE_SIZE = int(os.getenv("SQL_PLAN_CACHE_SIZE", "512"))
+
+# 自然语言查询中的字面量：引号内的内容，或含数字的编号/日期/数值（如 SCJSD20231226-SCGLB01、2025-10-20、100）
+_QUERY_LITERAL = re.compile(
+    r"[“\"'「『]([^”\"'」』]+)[”\"'」』]"
+    r"|(?<![A-Za-z0-9_\-./:])([A-Za-z0-9](?:[A-Za-z0-9_\-./:]*[A-Za-z0-9])?)"
+)
+# SQL中的字符串常量、双引号标识符和数值常量
+_SQL_TOKEN = re.compile(
+    r"'((?:''|[^'])*)'"
+    r"|\"(?:[^\"])*\""
+    r"|(?<![A-Za-z0-9_.])(\d+(?:\.\d+)?)(?![A-Za-z0-9_.])"
+)
+
+
+def extract_literals(query: str) -> Tuple[str, List[str]]:
+    """把查询中的字面量替换为占位符，返回 (查询形状, 字面量列表)"""
+    literals: List[str] = []
+
+    def _replace(m):
+        value = m.group(1) if m.group(1) is not None else m.group(2)
+        # 不含数字的英文单词（如 SAP、status）属于查询语义的一部分，不作为字面量
+        if m.group(1) is None and not any(ch.isdigit() for ch in value):
+            return value
+        literals.append(value)
+        return f"<L{len(literals) - 1}>"
+
+    shape = _QUERY_LITERAL.sub(_replace, query.strip())
+    shape = re.sub(r"\s+", " ", shape).lower()
+    return shape, literals
+
+
+def parameterize(sql: str, literals: List[str]) -> Optional[Tuple[str, List[Tuple[int, bool]]]]:
+    """把SQL中与查询字面量完全一致的常量替换为 ? 占位符。
+
+    返回 (参数化SQL, 每个占位符对应的 (字面量下标, 是否数值))；有字面量未出现在SQL中、或字面量取值重复
+    导致无法确定对应关系时返回None（此时不能安全地复用该SQL）。
+    """
+    if len(set(literals)) != len(literals):
+        return None
+    index_of = {value: i for i, value in enumerate(literals)}
+    params: List[Tuple[int, bool]] = []
+
+    def _replace(m):
+        if m.group(1) is not None:
+            value, numeric = m.group(1).replace("''", "'"), False
+        elif m.group(2) is not None:
+            value, numeric = m.group(2), True
+        else:
+            return m.group(0)
+        i = index_of.get(value)
+        if i is None:
+            return m.group(0)
+        params.append((i, numeric))
+        return "?"
+
+    template = _SQL_TOKEN.sub(_replace, sql)
+    if {i for i, _ in params} != set(range(len(literals))):
+        return None
+    return template, params
+
+
+def _bind(value: str, numeric: bool):
+    if not numeric:
+        return value
+    return float(value) if "." in value else int(value)
+
+
+def render_sql(template: str, params: List) -> str:
+    """把参数代回参数化SQL，仅用于展示和日志"""
+    values = iter(params)
+
+    def _replace(m):
+        if m.group(0) != "?":
+            return m.group(0)
+        value = next(values)
+        return str(value) if isinstance(value, (int, float)) else "'" + str(value).replace("'", "''") + "'"
+
+    return re.sub(r"'(?:''|[^'])*'|\"[^\"]*\"|\?", _replace, template)
+
+
+class SQLPlanCache:
+    """NL-to-SQL 计划缓存：按 (表集合, 查询形状) 缓存已成功执行的参数化SQL。
+
+    schema注册表版本变化时整体失效。
+    """
+
+    def __init__(self, max_entries: int = SQL_PLAN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Tuple[str, List[Tuple[int, bool]]]]" = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, tables: List[str], shape: str) -> tuple:
+        snapshot = get_schema_registry().snapshot()
+        with self._lock:
+            if snapshot.version != self._version:
+                if self._entries:
+                    logger.info(f"schema注册表更新到 v{snapshot.version}，清空SQL计划缓存")
+                self._entries.clear()
+                self._version = snapshot.version
+        return tuple(sorted({snapshot.canonical_name(t) for t in tables})), shape
+
+    def lookup(self, tables: List[str], query: str) -> Optional[Tuple[str, List]]:
+        """命中时返回 (参数化SQL, 参数列表)"""
+        shape, literals = extract_literals(query)
+        key = self._key(tables, shape)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        template, param_specs = entry
+        # 同一形状的查询字面量个数一致，按下标把本次查询的字面量绑定到占位符
+        try:
+            return template, [_bind(literals[i], numeric) for i, numeric in param_specs]
+        except ValueError:
+            # 原来是数值的位置这次不是数值，不能复用
+            return None
+
+    def store(self, tables: List[str], query: str, sql: str) -> bool:
+        """缓存一条已验证（执行成功）的SQL，无法参数化时不缓存"""
+        shape, literals = extract_literals(query)
+        plan = parameterize(sql, literals)
+        if plan is None:
+            return False
+        key = self._key(tables, shape)
+        with self._lock:
+            self._entries[key] = plan
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+_plan_cache = SQLPlanCache()
+
+
+def get_plan_cache() -> SQLPlanCache:
+    return _plan_cache
@@ -0,0 +1,160 @@
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from urllib.parse import quote
+from dotenv import load_dotenv, find_dotenv
+
+load_dotenv(find_dotenv())
+
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# 负数表示以KiB为单位
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+SQLITE_STATEMENT_CACHE = int(os.getenv("SQLITE_STATEMENT_CACHE", "256"))
+# 跨库查询时单个连接最多ATTACH的附加库数量（SQLite默认上限为10）
+SEARCH_MAX_ATTACH = int(os.getenv("SEARCH_MAX_ATTACH", "4"))
+
+
+def _ro_uri(db_path: str) -> str:
+    return f"file:{quote(os.path.abspath(db_path))}?mode=ro"
+
+
+def attach_aliases(db_paths: list[str]) -> dict[str, str]:
+    """为一组数据库分配SQL中使用的库别名：第一个为 main，其余按文件名生成且互不重复"""
+    aliases: dict[str, str] = {}
+    used = {"main", "temp"}
+    for path in db_paths:
+        if path in aliases:
+            continue
+        if not aliases:
+            aliases[path] = "main"
+            continue
+        stem = os.path.splitext(os.path.basename(path))[0]
+        base = re.sub(r"\W", "_", stem, flags=re.ASCII).strip("_").lower() or "db"
+        if base[0].isdigit():
+            base = "db_" + base
+        alias, n = base, 2
+        while alias in used:
+            alias, n = f"{base}_{n}", n + 1
+        used.add(alias)
+        aliases[path] = alias
+    return aliases
+
+
+class ReadOnlyPool:
+    """单个数据库文件（可附加其他库）的只读连接池。
+
+    连接以 mode=ro 的URI打开并设置 query_only，开启mmap与较大的页缓存，
+    每个连接自带预编译语句缓存；用完归还，不再每次查询都重新打开数据库。
+    attached 为 {别名: 数据库路径}，建立连接时以只读方式ATTACH，用于跨库联合查询。
+    """
+
+    def __init__(self, db_path: str, size: int = SQLITE_POOL_SIZE, attached: dict[str, str] | None = None):
+        self.db_path = db_path
+        self.size = size
+        self.attached = dict(attached or {})
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(_ro_uri(self.db_path), uri=True, check_same_thread=False,
+                               cached_statements=SQLITE_STATEMENT_CACHE)
+        try:
+            for alias, path in self.attached.items():
+                if not os.path.exists(path):
+                    raise sqlite3.OperationalError(f"unable to open database file: {path}")
+                conn.execute(f'ATTACH DATABASE ? AS "{alias}"', (_ro_uri(path),))
+        except BaseException:
+            conn.close()
+            raise
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = {SQLITE_CACHE_SIZE}")
+        return conn
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                conn = self._connect()
+                self._created += 1
+                return conn
+        try:
+            return self._idle.get(timeout=SQLITE_POOL_TIMEOUT)
+        except queue.Empty:
+            raise RuntimeError(f"连接池已耗尽（大小 {self.size}，已等待 {SQLITE_POOL_TIMEOUT:g} 秒）: {self.db_path}") from None
+
+    def release(self, conn: sqlite3.Connection):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    def discard(self, conn: sqlite3.Connection):
+        """丢弃异常状态的连接，释放一个名额"""
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._created -= 1
+
+    def detach(self, conn: sqlite3.Connection):
+        """把连接移出连接池（如交给结果句柄长期持有），由调用方负责关闭"""
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        except sqlite3.DatabaseError:
+            self.release(conn)
+            raise
+        except BaseException:
+            self.discard(conn)
+            raise
+        else:
+            self.release(conn)
+
+
+_pools: dict[tuple, ReadOnlyPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: str, attached: dict[str, str] | None = None) -> ReadOnlyPool:
+    """按 (主库, 附加库集合) 获取连接池"""
+    key = (db_path, tuple(sorted((attached or {}).items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = _pools[key] = ReadOnlyPool(db_path, attached=attached)
+    return pool
+
+
+_columns_cache: dict[tuple, list[str]] = {}
+_columns_lock = threading.Lock()
+
+
+def get_table_columns(db_path: str, table_name: str) -> list[str]:
+    """PRAGMA table_info 的结果按 (库, 表) 缓存，数据库文件被修改后自动重新读取"""
+    mtime = os.stat(db_path).st_mtime_ns
+    key = (db_path, table_name)
+    with _columns_lock:
+        cached = _columns_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with get_pool(db_path).connection() as conn:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table_name});")]
+    with _columns_lock:
+        _columns_cache[key] = (mtime, columns)
+    return columns
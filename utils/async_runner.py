@@ -0,0 +1,36 @@
+import asyncio
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """获取进程内共享的后台事件循环（守护线程中常驻运行）。
+
+    长连接对象（如MCP会话）绑定在创建它的事件循环上，同步代码通过 run_sync
+    把协程提交到同一个循环，避免每次 asyncio.run 都新建循环、重建连接。
+    """
+    global _loop
+    if _loop is not None and _loop.is_running():
+        return _loop
+    with _loop_lock:
+        if _loop is None or not _loop.is_running():
+            loop = asyncio.new_event_loop()
+            started = threading.Event()
+
+            def _run():
+                asyncio.set_event_loop(loop)
+                loop.call_soon(started.set)
+                loop.run_forever()
+
+            threading.Thread(target=_run, name="async-runner", daemon=True).start()
+            started.wait()
+            _loop = loop
+    return _loop
+
+
+def run_sync(coro, timeout: float | None = None):
+    """在后台事件循环中执行协程并同步等待结果。"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_background_loop())
+    return future.result(timeout)
@@ -1,12 +1,109 @@
 import sqlite3
+import asyncio
 import json
 import threading
 import os
+from collections import OrderedDict
 from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv())
 
 DB_PATH = os.getenv("WHITEBOARD_DB", "whiteboard.db")
-_lock = threading.Lock()  
+# 进程内最多缓存多少个board的消息；iter_messages 每批读取的行数
+WHITEBOARD_CACHE_BOARDS = int(os.getenv("WHITEBOARD_CACHE_BOARDS", "256"))
+WHITEBOARD_BATCH_SIZE = int(os.getenv("WHITEBOARD_BATCH_SIZE", "256"))
+
+# 每个线程复用一个连接；建表只在进程内执行一次；同一board的写操作在进程内串行
+_local = threading.local()
+_init_lock = threading.Lock()
+_initialized_paths: set[str] = set()
+_board_locks: dict[str, threading.Lock] = {}
+_board_locks_guard = threading.Lock()
+_board_cache: "OrderedDict[str, _BoardCache]" = OrderedDict()
+_board_cache_guard = threading.Lock()
+
+
+def _get_conn() -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(DB_PATH)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _ensure_schema(conn)
+        conns[DB_PATH] = conn
+    return conn
+
+
+def _ensure_schema(conn: sqlite3.Connection):
+    if DB_PATH in _initialized_paths:
+        return
+    with _init_lock:
+        if DB_PATH in _initialized_paths:
+            return
+        existed = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'message_boards'"
+        ).fetchone() is not None
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS message_boards (
+                board_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp REAL DEFAULT (strftime('%s', 'now')),
+                seq INTEGER NOT NULL,
+                PRIMARY KEY (board_id, seq)
+            )
+        """)
+        if existed:
+            # 旧版本建的表没有主键，补一个 (board_id, seq) 复合索引
+            conn.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_message_boards_board_seq ON message_boards (board_id, seq)"
+            )
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS board_seq (
+                board_id TEXT PRIMARY KEY,
+                next_seq INTEGER DEFAULT 0,
+                epoch INTEGER DEFAULT 0
+            )
+        """)
+        # epoch 在每次clear时递增，用于让其他进程中的消息缓存失效
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(board_seq)")]
+        if "epoch" not in columns:
+            conn.execute("ALTER TABLE board_seq ADD COLUMN epoch INTEGER DEFAULT 0")
+        conn.commit()
+        _initialized_paths.add(DB_PATH)
+
+
+def _board_lock(board_id: str) -> threading.Lock:
+    lock = _board_locks.get(board_id)
+    if lock is None:
+        with _board_locks_guard:
+            lock = _board_locks.setdefault(board_id, threading.Lock())
+    return lock
+
+
+class _BoardCache:
+    """单个board已加载的消息，只增量加载 last_seq 之后的新消息"""
+
+    __slots__ = ("epoch", "last_seq", "messages")
+
+    def __init__(self, epoch: int):
+        self.epoch = epoch
+        self.last_seq = 0
+        self.messages: list[dict] = []
+
+
+def _get_board_cache(board_id: str, epoch: int, next_seq: int) -> _BoardCache:
+    with _board_cache_guard:
+        cache = _board_cache.get(board_id)
+        # board被清空过（epoch变化或序号回退）时丢弃旧缓存
+        if cache is None or cache.epoch != epoch or cache.last_seq > next_seq:
+            cache = _board_cache[board_id] = _BoardCache(epoch)
+        _board_cache.move_to_end(board_id)
+        while len(_board_cache) > WHITEBOARD_CACHE_BOARDS:
+            _board_cache.popitem(last=False)
+        return cache
+
 
 class Whiteboard:
     def __init__(self, board_id: str):
@@ -16,24 +113,7 @@ class Whiteboard:
         self._init_db()
 
     def _init_db(self):
-        with _lock:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS message_boards (
-                    board_id TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    timestamp REAL DEFAULT (strftime('%s', 'now')),
-                    seq INTEGER
-                )
-            """)
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS board_seq (
-                    board_id TEXT PRIMARY KEY,
-                    next_seq INTEGER DEFAULT 0
-                )
-            """)
-            conn.commit()
-            conn.close()
+        _get_conn()
 
     def append(self, message: dict):
         """
@@ -41,54 +121,109 @@ class Whiteboard:
         """
         if not isinstance(message, dict):
             raise TypeError("message must be a dict")
-        serialized = json.dumps(message, ensure_ascii=False)
+        self.append_many([message])
 
-        with _lock:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            cursor = conn.cursor()
-
-            cursor.execute("INSERT OR IGNORE INTO board_seq (board_id, next_seq) VALUES (?, 0)", (self.board_id,))
-            cursor.execute("UPDATE board_seq SET next_seq = next_seq + 1 WHERE board_id = ?", (self.board_id,))
-            cursor.execute("SELECT next_seq FROM board_seq WHERE board_id = ?", (self.board_id,))
-            seq = cursor.fetchone()[0]
+    def append_many(self, messages: list[dict]):
+        """
+        在一个事务中追加多条消息，序号连续分配，整批只提交一次
+        """
+        if not all(isinstance(message, dict) for message in messages):
+            raise TypeError("message must be a dict")
+        if not messages:
+            return
+        serialized = [json.dumps(message, ensure_ascii=False) for message in messages]
+        count = len(serialized)
 
-            cursor.execute(
+        conn = _get_conn()
+        with _board_lock(self.board_id), conn:
+            # 单条语句原子地分配整批序号
+            last_seq = conn.execute(
+                "INSERT INTO board_seq (board_id, next_seq) VALUES (?, ?) "
+                "ON CONFLICT(board_id) DO UPDATE SET next_seq = next_seq + ? RETURNING next_seq",
+                (self.board_id, count, count)
+            ).fetchone()[0]
+            first_seq = last_seq - count + 1
+            conn.executemany(
                 "INSERT INTO message_boards (board_id, message, seq) VALUES (?, ?, ?)",
-                (self.board_id, serialized, seq)
+                [(self.board_id, message, first_seq + i) for i, message in enumerate(serialized)]
             )
-            conn.commit()
-            conn.close()
 
     def read(self) -> list[dict]:
         """
         返回按顺序排列的消息列表
+
+        消息缓存在进程内，每次只从数据库加载上次读取之后新增的消息。
         """
-        with _lock:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            cursor = conn.execute(
-                "SELECT message FROM message_boards WHERE board_id = ? ORDER BY seq ASC",
-                (self.board_id,)
-            )
-            rows = cursor.fetchall()
-            conn.close()
-            return [json.loads(row[0]) for row in rows]
+        conn = _get_conn()
+        with _board_lock(self.board_id):
+            row = conn.execute(
+                "SELECT epoch, next_seq FROM board_seq WHERE board_id = ?", (self.board_id,)
+            ).fetchone()
+            epoch, next_seq = row if row else (0, 0)
+            cache = _get_board_cache(self.board_id, epoch, next_seq)
+            if cache.last_seq < next_seq:
+                for seq, message in self._iter_rows(cache.last_seq):
+                    cache.messages.append(message)
+                    cache.last_seq = seq
+            return list(cache.messages)
+
+    def read_since(self, seq: int) -> tuple[list[dict], int]:
+        """
+        返回序号大于 seq 的消息及新的游标（最后一条消息的序号），调用方保存游标用于下次增量读取
+        """
+        messages = []
+        last_seq = seq
+        for last_seq, message in self._iter_rows(seq):
+            messages.append(message)
+        return messages, last_seq
+
+    def iter_messages(self, since_seq: int = 0):
+        """
+        按顺序逐条产出消息，分批从数据库读取，不会一次性加载整个board
+        """
+        for _, message in self._iter_rows(since_seq):
+            yield message
+
+    def _iter_rows(self, since_seq: int = 0, batch_size: int = WHITEBOARD_BATCH_SIZE):
+        conn = _get_conn()
+        last_seq = since_seq
+        while True:
+            rows = conn.execute(
+                "SELECT seq, message FROM message_boards WHERE board_id = ? AND seq > ? ORDER BY seq ASC LIMIT ?",
+                (self.board_id, last_seq, batch_size)
+            ).fetchall()
+            for seq, message in rows:
+                yield seq, json.loads(message)
+            if len(rows) < batch_size:
+                return
+            last_seq = rows[-1][0]
 
     def clear(self):
         """清空该 board_id 的所有消息"""
-        with _lock:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
+        conn = _get_conn()
+        with _board_lock(self.board_id), conn:
             conn.execute("DELETE FROM message_boards WHERE board_id = ?", (self.board_id,))
-            conn.execute("UPDATE board_seq SET next_seq = 0 WHERE board_id = ?", (self.board_id,))
-            conn.commit()
-            conn.close()
+            conn.execute(
+                "UPDATE board_seq SET next_seq = 0, epoch = epoch + 1 WHERE board_id = ?", (self.board_id,)
+            )
+            with _board_cache_guard:
+                _board_cache.pop(self.board_id, None)
+
+    async def aappend(self, message: dict):
+        """append 的异步版本，数据库写入放到线程池中执行，不阻塞事件循环"""
+        await asyncio.to_thread(self.append, message)
+
+    async def aappend_many(self, messages: list[dict]):
+        """append_many 的异步版本"""
+        await asyncio.to_thread(self.append_many, messages)
+
+    async def aread(self) -> list[dict]:
+        """read 的异步版本"""
+        return await asyncio.to_thread(self.read)
 
     def __len__(self):
-        with _lock:
-            conn = sqlite3.connect(DB_PATH, timeout=10)
-            cursor = conn.execute("SELECT COUNT(*) FROM message_boards WHERE board_id = ?", (self.board_id,))
-            count = cursor.fetchone()[0]
-            conn.close()
-            return count
+        cursor = _get_conn().execute("SELECT COUNT(*) FROM message_boards WHERE board_id = ?", (self.board_id,))
+        return cursor.fetchone()[0]
 
 if __name__ == "__main__":
     whiteboard = Whiteboard("test_board")